@@ -1,18 +1,34 @@
 #!/usr/bin/env python3
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify
+import hashlib
+import hmac
 import json
+import logging
 import os
-import subprocess
 import threading
-import feedparser
-import requests
-import re
-import html as html_module
-from io import BytesIO
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import http_client
+import logs
+from description_parser import parse_description
+from feed_parser import parse_feed, json_entry
+from text_splitter import split_text_into_chunks, URL_LENGTH
+from metrics import registry
 
 app = Flask(__name__)
+log = logging.getLogger(__name__)
 
 CONFIG_FILE = "config.json"
+METRICS_FILE = "metrics.prom"
+# Set by main.py when the bot runs in this process: its metrics are then in
+# the registry and config changes reach it through config_listeners.
+BOT_EMBEDDED = False
+config_listeners = []
+# bot.ingest when the bot runs in this process; pushed entries need it.
+ingest_handler = None
+TEST_WORKERS = 2
+TEST_RUNS_KEPT = 20
 
 DEFAULT_CONFIG = {
     "MASTODON_URL": "https://mastodon.social",
@@ -27,6 +43,36 @@ DEFAULT_CONFIG = {
     "CONTINUATION_MESSAGE": "[La suite dans les commentaires 👇]"
 }
 
+SECRET_MASK = "***hidden***"
+
+def is_secret(key):
+    return 'TOKEN' in key or 'PASSWORD' in key or 'SECRET' in key
+
+def masked_config(config):
+    # Tokens and secrets never leave the server; the form sends the mask
+    # back and update_config_endpoint() keeps the stored value.
+    masked = {key: SECRET_MASK if is_secret(key) and value else value for key, value in config.items()}
+    if isinstance(config.get("FEEDS"), list):
+        masked["FEEDS"] = [masked_config(feed) if isinstance(feed, dict) else feed for feed in config["FEEDS"]]
+    return masked
+
+def unmask_config(data, config):
+    # A masked value takes the stored one of the same key; feeds are matched
+    # by name as bot.load_feeds() names them. A mask with nothing stored
+    # behind it is refused rather than saved or guessed.
+    for key, value in data.items():
+        if is_secret(key) and value == SECRET_MASK:
+            if not config.get(key):
+                raise ValueError(f"{key} masqué sans valeur enregistrée")
+            data[key] = config[key]
+    if isinstance(data.get("FEEDS"), list):
+        stored = {feed_name(config, feed): feed for feed in config.get("FEEDS") or [] if isinstance(feed, dict)}
+        for feed in data["FEEDS"]:
+            if isinstance(feed, dict):
+                name = feed_name({**config, **data}, feed)
+                unmask_config(feed, stored.get(name, {}))
+    return data
+
 def load_config():
     if os.path.exists(CONFIG_FILE):
         try:
@@ -41,7 +87,7 @@ def save_config(config):
         with open(CONFIG_FILE, 'w') as f:
             json.dump(config, f, indent=4)
     except Exception as e:
-        print(f"[WEB UI] ❌ Erreur écriture config: {e}")
+        log.error(f"[WEB UI] ❌ Erreur écriture config: {e}")
 
 def update_env_file():
     try:
@@ -53,152 +99,104 @@ RSSHUB_URL={config['RSSHUB_URL']}
         with open('.env', 'w') as f:
             f.write(env_content)
     except Exception as e:
-        print(f"[WEB UI] ❌ Erreur écriture .env: {e}")
-
-def clean_description(description_html):
-    if not description_html:
-        return ""
-    
-    text = re.sub(r'<(?:div|blockquote|span)[^>]*class="rsshub-quote"[^>]*>.*?</(?:div|blockquote|span)>', '', description_html, flags=re.DOTALL)
-    text = text.replace('<br/>', '\n').replace('<br>', '\n').replace('<br />', '\n')
-    text = re.sub(r'<img[^>]*>', '', text)
-    text = re.sub(r'<a[^>]*>', '', text)
-    text = re.sub(r'</a>', '', text)
-    text = re.sub('<[^<]+?>', '', text)
-    text = html_module.unescape(text)
-    
-    lines = text.split('\n')
-    text = '\n'.join([' '.join(line.split()) for line in lines])
-    text = text.strip()
-    text = text.encode('utf-8', errors='ignore').decode('utf-8')
-    
-    return text
-
-def extract_media_from_description(description_html):
-    media_urls = {
-        'videos': [],
-        'images': []
-    }
-    
-    if not description_html:
-        return []
-    
-    description_decoded = html_module.unescape(description_html)
-    
-    video_pattern = r'(?:https?://(?:video|cdn)\.twimg\.com/[^\s<>"]+\.(?:mp4|webm|mov|m3u8))'
-    video_urls = re.findall(video_pattern, description_decoded, re.IGNORECASE)
-    for url in video_urls:
-        url = html_module.unescape(url)
-        url = url.split('?')[0]
-        if url and url not in media_urls['videos']:
-            media_urls['videos'].append(url)
-    
-    img_pattern = r'<img[^>]+src=["\']([^"\']+)["\']'
-    img_urls = re.findall(img_pattern, description_decoded)
-    for url in img_urls:
-        url = html_module.unescape(url)
-        if url and url not in media_urls['images']:
-            media_urls['images'].append(url)
-    
-    img_src_pattern = r'(?:https?://pbs\.twimg\.com/media/[^\s<>"]+\.(?:jpg|jpeg|png|gif))'
-    img_src_urls = re.findall(img_src_pattern, description_decoded, re.IGNORECASE)
-    for url in img_src_urls:
-        url = html_module.unescape(url)
-        url = url.split('?')[0]
-        if url and url not in media_urls['images']:
-            media_urls['images'].append(url)
-    
-    result = media_urls['videos'] + media_urls['images']
-    return result
+        log.error(f"[WEB UI] ❌ Erreur écriture .env: {e}")
 
 def upload_media_test(url, token, mastodon_url):
     try:
-        print(f"[TEST] Uploading: {url[:60]}")
-        r = requests.get(url, timeout=15)
+        log.debug(f"[TEST] Uploading: {url[:60]}")
+        r = http_client.get(url)
         if r.status_code == 200:
             headers = {"Authorization": f"Bearer {token}"}
-            files = {"file": BytesIO(r.content)}
-            resp = requests.post(f"{mastodon_url}/api/v1/media", headers=headers, files=files)
+            files = {"file": r.content}
+            resp = http_client.post(f"{mastodon_url}/api/v1/media", headers=headers, files=files, timeout=(http_client.CONNECT_TIMEOUT, 300))
             if resp.status_code == 200:
                 media_id = resp.json()["id"]
-                print(f"[TEST] ✅ Uploaded: {media_id}")
+                log.info(f"[TEST] ✅ Uploaded: {media_id}")
                 return media_id
             else:
-                print(f"[TEST] ❌ Upload failed: {resp.status_code}")
+                log.error(f"[TEST] ❌ Upload failed: {resp.status_code}")
         return None
     except Exception as e:
-        print(f"[TEST] ❌ Error: {str(e)[:100]}")
+        log.error(f"[TEST] ❌ Error: {str(e)[:100]}")
         return None
 
-@app.route('/')
-def index():
-    config = load_config()
-    return render_template('index.html', config=config)
-
-@app.route('/api/config', methods=['GET'])
-def get_config():
-    config = load_config()
-    return jsonify(config)
+# Test runs go through a small pool so a slow video upload never holds a
+# request thread; the page polls /api/test/<id> for the outcome.
+test_pool = ThreadPoolExecutor(max_workers=TEST_WORKERS, thread_name_prefix="test")
+test_runs = {}
+test_lock = threading.Lock()
 
-@app.route('/api/config', methods=['POST'])
-def update_config_endpoint():
+def instance_limits(mastodon_url, config):
+    limits = {
+        "max_characters": int(config.get("MAX_CHAR_PER_POST", DEFAULT_CONFIG["MAX_CHAR_PER_POST"])),
+        "characters_reserved_per_url": URL_LENGTH,
+        "max_media_attachments": 4,
+    }
     try:
-        data = request.json
-        config = load_config()
-        config.update(data)
-        save_config(config)
-        update_env_file()
-        
-        print(f"\n[WEB UI] ⚙️ Configuration mise à jour:")
-        for key, value in data.items():
-            if 'TOKEN' in key or 'PASSWORD' in key:
-                print(f"  - {key}: ***hidden***")
-            else:
-                print(f"  - {key}: {value[:80] if isinstance(value, str) else value}")
-        print()
-        
-        return jsonify({"status": "success", "message": "Configuration mise à jour"})
+        r = http_client.get(f"{mastodon_url}/api/v2/instance")
+        if r.status_code == 200:
+            statuses = r.json().get("configuration", {}).get("statuses", {})
+            limits.update((key, int(statuses[key])) for key in limits if key in statuses)
     except Exception as e:
-        print(f"[WEB UI] ❌ Erreur config: {e}")
-        return jsonify({"status": "error", "message": str(e)}), 500
+        log.warning(f"[TEST] ⚠️ Instance: {e}")
+    return limits
 
-@app.route('/api/test', methods=['POST'])
-def test_post():
+def update_run(run, **fields):
+    with test_lock:
+        run.update(fields)
+
+def run_test(run, config):
+    rsshub_url = config.get("RSSHUB_URL", "")
+    token = config.get("MASTODON_TOKEN", "")
+    mastodon_url = config.get("MASTODON_URL", "https://mastodon.social")
+    update_run(run, status="running")
     try:
-        config = load_config()
-        rsshub_url = config.get("RSSHUB_URL", "")
-        token = config.get("MASTODON_TOKEN", "")
-        mastodon_url = config.get("MASTODON_URL", "https://mastodon.social")
-        
-        if not rsshub_url or not token:
-            return jsonify({"status": "error", "message": "Config manquante"}), 400
+        log.info(f"[TEST] 🧪 Début du test{' (aperçu)' if run['dry_run'] else ''}...")
         
-        print("\n[TEST] 🧪 Début du test...")
-        
-        print(f"[TEST] Fetching: {rsshub_url}")
+        log.debug(f"[TEST] Fetching: {rsshub_url}")
         headers_request = {'User-Agent': 'Mozilla/5.0'}
-        response = requests.get(rsshub_url, headers=headers_request, timeout=10)
-        print(f"[TEST] Response: {response.status_code}")
+        response = http_client.get(rsshub_url, headers=headers_request)
+        log.debug(f"[TEST] Response: {response.status_code}")
         
-        feed = feedparser.parse(response.content)
-        print(f"[TEST] Entries: {len(feed.entries) if hasattr(feed, 'entries') else 0}")
+        feed = parse_feed(response.content)
+        log.debug(f"[TEST] Entries: {len(feed.entries) if hasattr(feed, 'entries') else 0}")
         
         if not hasattr(feed, 'entries') or len(feed.entries) == 0:
-            return jsonify({"status": "error", "message": "Aucun entry trouvé"}), 400
+            raise ValueError("Aucun entry trouvé")
         
         entry = feed.entries[0]
         tweet_url = entry.link if hasattr(entry, 'link') else ""
         tweet_description_html = entry.description if hasattr(entry, 'description') else (entry.title if hasattr(entry, 'title') else "")
         
-        tweet_description = clean_description(tweet_description_html)
-        print(f"[TEST] Text: {tweet_description[:80]}")
+        tweet_description, description_media = parse_description(tweet_description_html)
+        log.debug(f"[TEST] Text: {tweet_description[:80]}")
+        
+        if run["dry_run"]:
+            # What the bot would post, without uploading or posting anything.
+            limits = instance_limits(mastodon_url, config)
+            chunks = split_text_into_chunks(
+                tweet_description,
+                limits["max_characters"],
+                config.get("CONTINUATION_MESSAGE", DEFAULT_CONFIG["CONTINUATION_MESSAGE"]),
+                limits["characters_reserved_per_url"],
+            )
+            media = description_media[:limits["max_media_attachments"]]
+            update_run(
+                run,
+                status="success",
+                message=f"👁️ Aperçu : {len(chunks)} post(s), {len(media)} média(s)",
+                url=tweet_url,
+                chunks=chunks,
+                media=media,
+            )
+            log.info(f"[TEST] ✅ Aperçu prêt")
+            return
         
         media_ids = []
-        description_media = extract_media_from_description(tweet_description_html)
         if description_media:
-            print(f"[TEST] Found {len(description_media)} medias")
+            log.debug(f"[TEST] Found {len(description_media)} medias")
             for img_url in description_media:
-                print(f"[TEST] Uploading: {img_url[:60]}")
+                log.debug(f"[TEST] Uploading: {img_url[:60]}")
                 media_id = upload_media_test(img_url, token, mastodon_url)
                 if media_id:
                     media_ids.append(media_id)
@@ -208,34 +206,232 @@ def test_post():
         
         if media_ids:
             data["media_ids"] = [media_ids[0]]
-            print(f"[TEST] Posting with media...")
+            log.debug(f"[TEST] Posting with media...")
         else:
-            print(f"[TEST] Posting without media...")
+            log.debug(f"[TEST] Posting without media...")
         
-        r = requests.post(f"{mastodon_url}/api/v1/statuses", headers=headers, json=data)
+        r = http_client.post(f"{mastodon_url}/api/v1/statuses", headers=headers, json=data)
         
         if r.status_code == 200:
             status_id = r.json()["id"]
-            print(f"[TEST] ✅ Posted! ID: {status_id}\n")
-            return jsonify({
-                "status": "success",
-                "message": f"✅ Post envoyé! ID: {status_id}",
-                "text": tweet_description[:100] + "...",
-                "media_count": len(media_ids)
-            })
+            log.info(f"[TEST] ✅ Posted! ID: {status_id}")
+            update_run(
+                run,
+                status="success",
+                message=f"✅ Post envoyé! ID: {status_id}",
+                text=tweet_description[:100] + "...",
+                media_count=len(media_ids),
+            )
         else:
-            print(f"[TEST] ❌ Failed: {r.status_code}\n")
-            return jsonify({
-                "status": "error",
-                "message": f"❌ Erreur Mastodon: {r.status_code}"
-            }), 500
+            log.error(f"[TEST] ❌ Failed: {r.status_code}")
+            update_run(run, status="error", message=f"❌ Erreur Mastodon: {r.status_code}")
+    
+    except Exception as e:
+        log.error(f"[TEST] ❌ Error: {str(e)}")
+        update_run(run, status="error", message=f"❌ Erreur: {str(e)[:200]}")
+    finally:
+        update_run(run, finished=time.time())
+
+def public_run(run):
+    # Copy without the dedup key (it holds the token); callers hold test_lock.
+    return {key: value for key, value in run.items() if key != "key"}
+
+def submit_test(config, dry_run):
+    # A second click while the same test is still running gets the run
+    # already in progress instead of starting another upload.
+    key = (dry_run, config.get("RSSHUB_URL"), config.get("MASTODON_URL"), config.get("MASTODON_TOKEN"))
+    with test_lock:
+        for run in test_runs.values():
+            if run["key"] == key and run["status"] in ("pending", "running"):
+                return public_run(run), False
+        finished = sorted((run for run in test_runs.values() if run.get("finished")), key=lambda run: run["finished"])
+        for run in finished[:max(len(finished) - TEST_RUNS_KEPT + 1, 0)]:
+            del test_runs[run["id"]]
+        run = {"id": uuid.uuid4().hex[:12], "key": key, "status": "pending", "dry_run": dry_run, "created": time.time()}
+        test_runs[run["id"]] = run
+        created = public_run(run)
+    test_pool.submit(run_test, run, config)
+    return created, True
+
+def apply_config(config):
+    http_client.configure(config)
+    logs.setup(config.get("LOG_LEVEL", os.getenv("LOG_LEVEL", logs.LEVEL)), config.get("LOG_FORMAT", os.getenv("LOG_FORMAT", logs.FORMAT)))
+
+apply_config(load_config())
+
+def metrics_file():
+    return load_config().get("METRICS_FILE", METRICS_FILE)
+
+def metrics_snapshot_age():
+    if BOT_EMBEDDED:
+        return []
+    try:
+        return [({}, time.time() - os.path.getmtime(metrics_file()))]
+    except OSError:
+        return []
+
+# The bot writes its metrics to a file every few seconds; a growing age
+# means the bot process is stuck or gone.
+registry.gauge("rss_bot_metrics_snapshot_age_seconds", "Age of the bot's metrics snapshot", callback=metrics_snapshot_age)
+
+@app.route('/')
+def index():
+    config = masked_config(load_config())
+    return render_template('index.html', config=config)
+
+@app.route('/api/config', methods=['GET'])
+def get_config():
+    return jsonify(masked_config(load_config()))
+
+@app.route('/api/config', methods=['POST'])
+def update_config_endpoint():
+    try:
+        config = load_config()
+        try:
+            data = unmask_config(request.json, config)
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+        config.update(data)
+        duplicates = duplicate_feed_names(config)
+        if duplicates:
+            return jsonify({"status": "error", "message": f"NAME en double dans FEEDS: {', '.join(duplicates)}"}), 400
+        save_config(config)
+        update_env_file()
+        apply_config(config)
+        for listener in config_listeners:
+            listener(config)
+        
+        changes = []
+        for key, value in data.items():
+            if is_secret(key):
+                changes.append(f"{key}={SECRET_MASK}")
+            else:
+                changes.append(f"{key}={value[:80] if isinstance(value, str) else value}")
+        log.info(f"[WEB UI] ⚙️ Configuration mise à jour: {', '.join(changes)}")
+        
+        return jsonify({"status": "success", "message": "Configuration mise à jour"})
+    except Exception as e:
+        log.error(f"[WEB UI] ❌ Erreur config: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/api/test', methods=['POST'])
+def test_post():
+    config = load_config()
+    if not config.get("RSSHUB_URL", "") or not config.get("MASTODON_TOKEN", ""):
+        return jsonify({"status": "error", "message": "Config manquante"}), 400
     
+    body = request.get_json(silent=True) or {}
+    dry_run = bool(body.get("dry_run")) or request.args.get("dry_run") in ("1", "true")
+    run, created = submit_test(config, dry_run)
+    if not created:
+        log.info(f"[TEST] Test {run['id']} déjà en cours")
+    return jsonify(public_run(run)), 202
+
+@app.route('/api/test/<run_id>', methods=['GET'])
+def test_status(run_id):
+    with test_lock:
+        run = test_runs.get(run_id)
+        if not run:
+            return jsonify({"status": "error", "message": "Test inconnu"}), 404
+        return jsonify(public_run(run))
+
+def feed_name(config, feed_config):
+    # As bot.load_feeds() names a feed: NAME, else its TWITTER_ACCOUNT.
+    if "NAME" in feed_config:
+        return feed_config["NAME"]
+    return feed_config.get("TWITTER_ACCOUNT", config.get("TWITTER_ACCOUNT"))
+
+def duplicate_feed_names(config):
+    names = [feed_name(config, feed) for feed in config.get("FEEDS") or [] if isinstance(feed, dict)]
+    return sorted({name for name in names if names.count(name) > 1})
+
+def ingest_feed(config, name):
+    # Feed settings as bot.load_feeds() builds them, enough to check a push.
+    for feed_config in config.get("FEEDS") or [{}]:
+        feed = dict(config)
+        feed.update(feed_config)
+        if feed_name(config, feed_config) == name:
+            return feed
+    return None
+
+def hub_signature_valid(secret, body, signature):
+    method, _, digest = signature.partition("=")
+    if method not in ("sha1", "sha256", "sha384", "sha512"):
+        return False
+    return hmac.compare_digest(hmac.new(secret.encode('utf-8'), body, method).hexdigest(), digest)
+
+def pushed_entries(body, mimetype):
+    # Generic webhook: one entry, a list or {"entries": [...]} as JSON.
+    # Anything else is a feed document, as WebSub hubs push it.
+    if mimetype == "application/json":
+        data = json.loads(body)
+        if isinstance(data, dict):
+            data = data.get("entries", [data])
+        entries = [json_entry(entry) for entry in data]
+    else:
+        entries = parse_feed(body).entries
+    if not entries:
+        raise ValueError("aucune entrée")
+    return entries
+
+@app.route('/api/ingest/<feed_name>', methods=['GET'])
+def ingest_verify(feed_name):
+    # WebSub hub confirming the subscription made by bot.websub_subscribe().
+    feed = ingest_feed(load_config(), feed_name)
+    mode = request.args.get("hub.mode")
+    if feed and mode == "denied":
+        log.warning(f"[WEBSUB] ⚠️ {feed_name}: abonnement refusé par le hub: {request.args.get('hub.reason', '')}")
+        return Response("", status=200)
+    topic = feed and feed.get("WEBSUB_TOPIC", feed.get("RSSHUB_URL"))
+    challenge = request.args.get("hub.challenge")
+    if not feed or mode not in ("subscribe", "unsubscribe") or not challenge or request.args.get("hub.topic") != topic:
+        return jsonify({"status": "error", "message": "Abonnement inconnu"}), 404
+    log.info(f"[WEBSUB] ✅ {feed_name}: {mode} confirmé, bail {request.args.get('hub.lease_seconds', '?')}s")
+    return Response(challenge, content_type="text/plain")
+
+@app.route('/api/ingest/<feed_name>', methods=['POST'])
+def ingest_post(feed_name):
+    config = load_config()
+    secret = config.get("INGEST_SECRET", "")
+    if not secret:
+        return jsonify({"status": "error", "message": "INGEST_SECRET non configuré"}), 403
+    body = request.get_data()
+    signature = request.headers.get("X-Hub-Signature-256") or request.headers.get("X-Hub-Signature")
+    if signature:
+        if not hub_signature_valid(secret, body, signature):
+            # WebSub: a bad signature is acknowledged and the content dropped.
+            log.warning(f"[PUSH] ⚠️ {feed_name}: signature invalide, contenu ignoré")
+            return jsonify({"status": "success", "queued": 0}), 202
+    elif not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {secret}"):
+        return jsonify({"status": "error", "message": "Non autorisé"}), 403
+    
+    if not ingest_feed(config, feed_name):
+        return jsonify({"status": "error", "message": "Flux inconnu"}), 404
+    if not ingest_handler:
+        return jsonify({"status": "error", "message": "Bot non lancé dans ce processus (utiliser main.py)"}), 503
+    try:
+        entries = pushed_entries(body, request.mimetype)
     except Exception as e:
-        print(f"[TEST] ❌ Error: {str(e)}\n")
-        return jsonify({
-            "status": "error",
-            "message": f"❌ Erreur: {str(e)[:200]}"
-        }), 500
+        return jsonify({"status": "error", "message": f"Contenu invalide: {str(e)[:150]}"}), 400
+    try:
+        queued = ingest_handler(feed_name, entries)
+    except RuntimeError:
+        # Between two runs (config reload, crash): the sender retries.
+        return jsonify({"status": "error", "message": "Bot en cours de redémarrage"}), 503
+    if queued is None:
+        return jsonify({"status": "error", "message": "Flux inconnu du bot"}), 404
+    return jsonify({"status": "success", "queued": queued}), 202
+
+@app.route('/metrics')
+def metrics_endpoint():
+    body = registry.render()
+    if not BOT_EMBEDDED:
+        try:
+            with open(metrics_file(), 'r', encoding='utf-8') as f:
+                body += f.read()
+        except FileNotFoundError:
+            pass
+    return Response(body, content_type="text/plain; version=0.0.4; charset=utf-8")
 
 @app.errorhandler(404)
 def not_found(error):
@@ -246,5 +442,5 @@ def server_error(error):
     return jsonify({"error": "Erreur serveur interne"}), 500
 
 if __name__ == '__main__':
-    print("\n[WEB UI] 🚀 Interface web démarrée sur http://0.0.0.0:5000\n")
+    log.info("[WEB UI] 🚀 Interface web démarrée sur http://0.0.0.0:5000")
     app.run(host='0.0.0.0', port=5000, debug=False, threaded=True)
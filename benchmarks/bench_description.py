@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# Micro-benchmark: description_parser (compiled patterns, one unescape,
+# linear dedup) against the clean_description() and
+# extract_media_from_description() it replaced. Each block of the synthetic
+# description carries new media URLs, which is where the legacy
+# `url not in list` dedup turns quadratic.
+#
+#   python benchmarks/bench_description.py [--sizes 2000,20000,200000,1000000] [--repeat 5]
+import argparse
+import html as html_module
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from description_parser import parse_description
+
+def legacy_extract_media(description_html):
+    media_urls = {
+        'videos': [],
+        'images': []
+    }
+    
+    if not description_html:
+        return []
+    
+    description_decoded = html_module.unescape(description_html)
+    
+    video_pattern = r'(?:https?://(?:video|cdn)\.twimg\.com/[^\s<>"]+\.(?:mp4|webm|mov|m3u8))'
+    video_urls = re.findall(video_pattern, description_decoded, re.IGNORECASE)
+    for url in video_urls:
+        url = html_module.unescape(url)
+        url = url.split('?')[0]
+        if url and url not in media_urls['videos']:
+            media_urls['videos'].append(url)
+    
+    img_pattern = r'<img[^>]+src=["\']([^"\']+)["\']'
+    img_urls = re.findall(img_pattern, description_decoded)
+    for url in img_urls:
+        url = html_module.unescape(url)
+        if url and url not in media_urls['images']:
+            media_urls['images'].append(url)
+    
+    media_pattern = r'<a[^>]+href=["\']([^"\']+\.(?:jpg|jpeg|png|gif))["\']'
+    media_urls_found = re.findall(media_pattern, description_decoded, re.IGNORECASE)
+    for url in media_urls_found:
+        url = html_module.unescape(url)
+        if url and url not in media_urls['images']:
+            media_urls['images'].append(url)
+    
+    img_src_pattern = r'(?:https?://pbs\.twimg\.com/media/[^\s<>"]+\.(?:jpg|jpeg|png|gif))'
+    img_src_urls = re.findall(img_src_pattern, description_decoded, re.IGNORECASE)
+    for url in img_src_urls:
+        url = html_module.unescape(url)
+        url = url.split('?')[0]
+        if url and url not in media_urls['images']:
+            media_urls['images'].append(url)
+    
+    result = media_urls['videos'] + media_urls['images']
+    return result
+
+def legacy_clean_description(description_html):
+    if not description_html:
+        return ""
+    
+    text = re.sub(r'<(?:div|blockquote|span)[^>]*class="rsshub-quote"[^>]*>.*?</(?:div|blockquote|span)>', '', description_html, flags=re.DOTALL)
+    text = text.replace('<br/>', '\n').replace('<br>', '\n').replace('<br />', '\n')
+    text = re.sub(r'<img[^>]*>', '', text)
+    text = re.sub(r'<a[^>]*>', '', text)
+    text = re.sub(r'</a>', '', text)
+    text = re.sub('<[^<]+?>', '', text)
+    text = html_module.unescape(text)
+    
+    lines = text.split('\n')
+    text = '\n'.join([' '.join(line.split()) for line in lines])
+    
+    text = text.strip()
+    text = text.encode('utf-8', errors='ignore').decode('utf-8')
+    
+    return text
+
+def build_description(size):
+    block = (
+        'Un long thread sur la politique &amp; l\'économie avec des <b>liens</b> '
+        '<a href="https://t.co/abc">t.co/abc</a> et du texte.<br>'
+        '<img src="https://pbs.twimg.com/media/F{n}.jpg" referrerpolicy="no-referrer"><br>'
+        '<video controls poster="https://pbs.twimg.com/ext_tw_video_thumb/{n}.jpg">'
+        '<source src="https://video.twimg.com/ext_tw_video/{n}/pu/vid/720x1280/v.mp4?tag=12" type="video/mp4"></video><br>'
+        '<div class="rsshub-quote">Citation <img src="https://pbs.twimg.com/media/Q{n}.png"></div>\n'
+    )
+    parts = []
+    n = 0
+    while sum(len(p) for p in parts) < size:
+        parts.append(block.format(n=n))
+        n += 1
+    return ''.join(parts)
+
+def measure(func, description, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(description)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def legacy(description):
+    return legacy_clean_description(description), legacy_extract_media(description)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="2000,20000,200000,1000000")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'size':>8} {'legacy ms':>10} {'parser ms':>10} {'speedup':>8}  same text/media")
+    for size in [int(s) for s in args.sizes.split(',')]:
+        description = build_description(size)
+        legacy_result = legacy(description)
+        new_result = parse_description(description)
+        same = (legacy_result[0] == new_result[0], legacy_result[1] == new_result[1])
+
+        legacy_time = measure(legacy, description, args.repeat)
+        new_time = measure(parse_description, description, args.repeat)
+        print(f"{len(description):>8} {legacy_time * 1000:>10.2f} {new_time * 1000:>10.2f} {legacy_time / new_time:>7.1f}x  {same}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+# End-to-end benchmark: runs the real start_bot() (fetch -> parse -> clean
+# -> split -> media download/upload -> post) against a local RSSHub and
+# Mastodon stand-in, and reports throughput, p50/p99 per stage, end-to-end
+# latency (queued -> last post of the thread) and peak RSS.
+#
+# The stand-ins run in a child process so the RSS figure is the bot's own.
+# Feeds are synthetic (entry count, description size, media per entry);
+# Mastodon answers with configurable latency and injects 422s on posts
+# with media and 429s on any POST. Job retries are shortened to 1 s so
+# injected failures are retried within the run.
+#
+#   python benchmarks/bench_e2e.py [--feeds 4] [--entries 50] [--description-size 800] [--media 2]
+#   python benchmarks/bench_e2e.py --latency 0.05 --media-latency 0.2 --error-rate 0.05 --rate-limit-rate 0.02
+#   python benchmarks/bench_e2e.py --min-throughput 300 --max-p99 5 [--json result.json]
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import re
+import resource
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from datetime import datetime, timedelta, timezone
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+WORDS = ["Le", "gouvernement", "annonce", "une", "réforme", "majeure", "des", "retraites", "aujourd'hui.",
+         "Selon", "les", "sources,", "le", "texte", "sera", "présenté", "https://t.co/AbCdEfGh12", "demain !"]
+ENTRY_PATTERN = re.compile(r'\[entry-([\w-]+)\]')
+STAGES = [
+    ("fetch", "rss_bot_fetch_seconds"),
+    ("parse", "rss_bot_parse_seconds"),
+    ("description", "rss_bot_description_seconds"),
+    ("split", "split"),
+    ("media download", "rss_bot_media_download_seconds"),
+    ("media upload", "rss_bot_media_upload_seconds"),
+    ("post", "rss_bot_post_seconds"),
+]
+
+def build_feed(name, entries, description_size, media, base_url, first_published, seed):
+    rng = random.Random(f"{seed}-{name}")
+    items = []
+    for i in reversed(range(entries)):
+        words = [f"[entry-{name}-{i}]"]
+        length = len(words[0])
+        while length < description_size:
+            word = rng.choice(WORDS)
+            words.append(word + rng.choices([" ", "<br>", "<br><br>"], weights=[30, 2, 1])[0])
+            length += len(word) + 1
+        images = "".join(f'<img src="{base_url}/media/{name}/{i}/{k}.jpg">' for k in range(media))
+        published = formatdate(first_published + i * 60, usegmt=True)
+        items.append(
+            f"<item><title>{name} {i}</title><link>https://x.com/{name}/status/{i}</link>"
+            f"<guid>https://x.com/{name}/status/{i}</guid><pubDate>{published}</pubDate>"
+            f"<description><![CDATA[{' '.join(words)}{images}]]></description></item>"
+        )
+    return f'<?xml version="1.0"?><rss version="2.0"><channel><title>{name}</title>{"".join(items)}</channel></rss>'.encode()
+
+def serve(port, args, first_published, ready):
+    # Fake RSSHub + Mastodon; keeps the arrival time of every status so the
+    # harness can compute end-to-end latency from /stats.
+    base_url = f"http://127.0.0.1:{port}"
+    feeds = {f"feed{n}": build_feed(f"feed{n}", args.entries, args.description_size, args.media, base_url, first_published, args.seed)
+             for n in range(args.feeds)}
+    media_body = b"\xff\xd8\xff\xe0" + b"0" * max(args.media_size - 4, 0)
+    rng = random.Random(args.seed)
+    lock = threading.Lock()
+    state = {"ids": 0, "status_entry": {}, "posted": {}, "statuses": 0, "media": 0, "injected_422": 0, "injected_429": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def send(self, code, body=b"", content_type="application/json", headers=()):
+            self.send_response(code)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for key, value in headers:
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def next_id(self):
+            with lock:
+                state["ids"] += 1
+                return str(state["ids"])
+
+        def rate_headers(self, remaining):
+            reset = (datetime.now(timezone.utc) + timedelta(seconds=1 if remaining == 0 else 300)).isoformat()
+            return [("X-RateLimit-Limit", "300000"), ("X-RateLimit-Remaining", str(remaining)), ("X-RateLimit-Reset", reset)]
+
+        def do_GET(self):
+            if self.path.startswith("/rss/"):
+                name = self.path.split("/")[2]
+                if self.headers.get("If-None-Match") == '"bench"':
+                    return self.send(304)
+                return self.send(200, feeds[name], "application/rss+xml", [("ETag", '"bench"')])
+            if self.path.startswith("/media/"):
+                return self.send(200, media_body, "image/jpeg")
+            if self.path == "/api/v2/instance":
+                statuses = {"max_characters": args.max_characters, "max_media_attachments": 4, "characters_reserved_per_url": 23}
+                return self.send(200, json.dumps({"configuration": {"statuses": statuses}}).encode())
+            if self.path == "/stats":
+                with lock:
+                    return self.send(200, json.dumps(state, default=list).encode())
+            self.send(404)
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            if rng.random() < args.rate_limit_rate:
+                with lock:
+                    state["injected_429"] += 1
+                return self.send(429, b"{}", headers=self.rate_headers(0))
+            if self.path == "/api/v2/media":
+                time.sleep(args.media_latency)
+                with lock:
+                    state["media"] += 1
+                return self.send(200, json.dumps({"id": self.next_id(), "url": "http://media"}).encode(), headers=self.rate_headers(299000))
+            if self.path == "/api/v1/statuses":
+                time.sleep(args.latency)
+                data = json.loads(body)
+                if data.get("media_ids") and rng.random() < args.error_rate:
+                    with lock:
+                        state["injected_422"] += 1
+                    return self.send(422, b'{"error": "injected"}', headers=self.rate_headers(299000))
+                status_id = self.next_id()
+                match = ENTRY_PATTERN.search(data["status"])
+                with lock:
+                    state["statuses"] += 1
+                    entry = match.group(1) if match else state["status_entry"].get(data.get("in_reply_to_id"))
+                    if entry:
+                        state["status_entry"][status_id] = entry
+                        state["posted"][entry] = time.time()
+                return self.send(200, json.dumps({"id": status_id}).encode(), headers=self.rate_headers(299000))
+            self.send(404)
+
+        def do_DELETE(self):
+            self.send(200, b"{}")
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    ready.set()
+    server.serve_forever()
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+def format_ms(value):
+    return f"{value * 1000:.1f}" if value is not None else "-"
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--feeds", type=int, default=4)
+    parser.add_argument("--accounts", type=int, default=2, help="Mastodon tokens the feeds are spread over")
+    parser.add_argument("--entries", type=int, default=50, help="entries per feed")
+    parser.add_argument("--description-size", type=int, default=800)
+    parser.add_argument("--media", type=int, default=1, help="images per entry")
+    parser.add_argument("--media-size", type=int, default=200_000)
+    parser.add_argument("--max-characters", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds per status POST")
+    parser.add_argument("--media-latency", type=float, default=0.05, help="seconds per media upload")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of posts with media answered 422")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of POSTs answered 429")
+    parser.add_argument("--port", type=int, default=8799)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--min-throughput", type=float, help="fail below this many entries per minute")
+    parser.add_argument("--max-p99", type=float, help="fail when the end-to-end p99 exceeds this many seconds")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+    if args.json:
+        args.json = os.path.abspath(args.json)
+
+    total = args.feeds * args.entries
+    first_published = time.time() - args.entries * 60
+    ready = multiprocessing.Event()
+    server = multiprocessing.Process(target=serve, args=(args.port, args, first_published, ready), daemon=True)
+    server.start()
+    ready.wait(30)
+    base_url = f"http://127.0.0.1:{args.port}"
+
+    workdir = tempfile.TemporaryDirectory()
+    os.chdir(workdir.name)
+    config = {
+        "MASTODON_URL": base_url,
+        "CHECK_INTERVAL": "600",
+        "LOG_LEVEL": args.log_level,
+        "FEEDS": [
+            {"NAME": f"feed{n}", "TWITTER_ACCOUNT": f"feed{n}", "RSSHUB_URL": f"{base_url}/rss/feed{n}", "MASTODON_TOKEN": f"token{n % args.accounts}"}
+            for n in range(args.feeds)
+        ],
+    }
+    with open("config.json", 'w', encoding='utf-8') as f:
+        json.dump(config, f)
+
+    import bot
+    import job_queue
+    import metrics
+
+    # Failed jobs come back within the run instead of after a minute.
+    job_queue.RETRY_DELAY = 1
+    bot.DISPATCH_INTERVAL = 1
+
+    # Raw samples next to the histograms, for exact percentiles.
+    samples = {}
+    observe = metrics.Histogram.observe
+    def record(histogram, value, **labels):
+        samples.setdefault(histogram.name, []).append(value)
+        observe(histogram, value, **labels)
+    metrics.Histogram.observe = record
+
+    split = bot.split_text_into_chunks
+    def timed_split(*split_args):
+        start = time.perf_counter()
+        try:
+            return split(*split_args)
+        finally:
+            samples.setdefault("split", []).append(time.perf_counter() - start)
+    bot.split_text_into_chunks = timed_split
+
+    queued = {}
+    enqueue = bot.jobs.enqueue
+    def timed_enqueue(feed_name, url, text, media_urls, account=""):
+        created = enqueue(feed_name, url, text, media_urls, account)
+        if created:
+            queued[f"{feed_name}-{url.rsplit('/', 1)[-1]}"] = time.time()
+        return created
+    bot.jobs.enqueue = timed_enqueue
+
+    # Everything in the feeds is newer than the watermark, so the whole
+    # backlog is queued (a fresh install would only take the latest entry).
+    for feed in config["FEEDS"]:
+        bot.jobs.set_watermark(feed["NAME"], "bench-seed", first_published - 1)
+
+    stop = threading.Event()
+    start = time.time()
+    runner = threading.Thread(target=bot.start_bot, args=(stop,), kwargs={"announce": False, "snapshot": False}, daemon=True)
+    runner.start()
+    while time.time() - start < args.timeout:
+        time.sleep(0.2)
+        if len(queued) == total and not len(bot.jobs) and not bot.in_flight:
+            break
+    timed_out = time.time() - start >= args.timeout
+    stop.set()
+    runner.join(30)
+
+    with urllib.request.urlopen(f"{base_url}/stats") as response:
+        stats = json.load(response)
+    server.terminate()
+
+    posted = stats["posted"]
+    latencies = [posted[entry] - queued[entry] for entry in posted if entry in queued]
+    elapsed = (max(posted.values()) - start) if posted else time.time() - start
+    throughput = len(posted) / elapsed * 60 if elapsed > 0 else 0
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    print(f"entries: {len(posted)}/{total} posted in {elapsed:.1f}s{' (timed out)' if timed_out else ''}")
+    print(f"throughput: {throughput:.1f} entries/min, {stats['statuses']} statuses, {stats['media']} media")
+    print(f"injected: {stats['injected_422']} x 422, {stats['injected_429']} x 429")
+    print(f"peak RSS: {peak_rss:.1f} MB")
+    print()
+    print(f"{'stage':>16} {'count':>7} {'p50 ms':>9} {'p99 ms':>9}")
+    results = {}
+    for label, name in STAGES + [("end-to-end", None)]:
+        values = latencies if name is None else samples.get(name, [])
+        p50, p99 = percentile(values, 0.5), percentile(values, 0.99)
+        results[label] = {"count": len(values), "p50": p50, "p99": p99}
+        print(f"{label:>16} {len(values):>7} {format_ms(p50):>9} {format_ms(p99):>9}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({
+                "posted": len(posted), "total": total, "elapsed": elapsed, "throughput": throughput,
+                "peak_rss_mb": peak_rss, "stages": results, "args": vars(args),
+            }, f, indent=2)
+
+    failures = []
+    if len(posted) < total:
+        failures.append(f"{total - len(posted)} entries not posted")
+    if args.min_throughput and throughput < args.min_throughput:
+        failures.append(f"throughput {throughput:.1f} < {args.min_throughput} entries/min")
+    end_to_end = results["end-to-end"]["p99"]
+    if args.max_p99 and end_to_end is not None and end_to_end > args.max_p99:
+        failures.append(f"end-to-end p99 {end_to_end:.2f}s > {args.max_p99}s")
+    for failure in failures:
+        print(f"FAIL {failure}")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
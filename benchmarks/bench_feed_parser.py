@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# Benchmark: feed_parser (streaming, stops at the watermark) against
+# feedparser.parse() on synthetic RSSHub feeds with long HTML descriptions.
+# "new" is the number of entries above the watermark, as on a regular poll.
+#
+#   python benchmarks/bench_feed_parser.py [--entries 20,100,500] [--description-size 3000] [--new 3] [--repeat 3]
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import feedparser
+from bench_e2e import build_feed
+from feed_parser import parse
+from polling import CADENCE_SAMPLES
+
+def measure(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", default="20,100,500")
+    parser.add_argument("--description-size", type=int, default=3000)
+    parser.add_argument("--media", type=int, default=2)
+    parser.add_argument("--new", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'entries':>8} {'KB':>7} {'feedparser ms':>14} {'stream ms':>10} {'watermark ms':>13} {'parsed':>7} {'speedup':>8}")
+    for entries in [int(n) for n in args.entries.split(',')]:
+        content = build_feed("bench", entries, args.description_size, args.media, "http://127.0.0.1", time.time() - entries * 60, 0)
+        feedparser_time, full = measure(lambda: feedparser.parse(content), args.repeat)
+        stream_time, _ = measure(lambda: parse(content), args.repeat)
+        watermark = full.entries[min(args.new, entries - 1)].id
+        watermark_time, partial = measure(lambda: parse(content, watermark, None, CADENCE_SAMPLES + 1), args.repeat)
+        print(f"{entries:>8} {len(content) / 1024:>7.0f} {feedparser_time * 1000:>14.1f} {stream_time * 1000:>10.1f} "
+              f"{watermark_time * 1000:>13.2f} {len(partial.entries):>7} {feedparser_time / watermark_time:>7.0f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# Benchmark: text_splitter.split_text_into_chunks() against the
+# character-by-character splitter it replaced, on multi-thousand-character
+# threads.
+#
+#   python benchmarks/bench_splitter.py [--sizes 2000,10000,50000] [--repeat 5]
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from text_splitter import split_text_into_chunks, mastodon_length
+
+MAX_CHAR_PER_POST = 490
+CONTINUATION_MESSAGE = "[La suite dans les commentaires 👇]"
+
+def legacy_split_text_into_chunks(text, max_length=MAX_CHAR_PER_POST):
+    if len(text) <= max_length:
+        return [text]
+    
+    chunks = []
+    current_chunk = ""
+    
+    i = 0
+    while i < len(text):
+        if len(current_chunk) < max_length - 30:
+            current_chunk += text[i]
+            i += 1
+        else:
+            last_newline = current_chunk.rfind('\n')
+            if last_newline > max_length * 0.7:
+                chunk_to_save = current_chunk[:last_newline].strip()
+                remaining = current_chunk[last_newline:].strip()
+                if chunk_to_save:
+                    chunks.append(chunk_to_save + "\n\n" + CONTINUATION_MESSAGE)
+                current_chunk = remaining
+            else:
+                last_space = current_chunk.rfind(' ')
+                if last_space > max_length * 0.6:
+                    chunk_to_save = current_chunk[:last_space].strip()
+                    remaining = current_chunk[last_space:].strip()
+                    if chunk_to_save:
+                        chunks.append(chunk_to_save + "\n\n" + CONTINUATION_MESSAGE)
+                    current_chunk = remaining
+                else:
+                    if current_chunk:
+                        chunks.append(current_chunk.strip() + "\n\n" + CONTINUATION_MESSAGE)
+                    current_chunk = ""
+    
+    if current_chunk.strip():
+        chunks.append(current_chunk.strip())
+    
+    return chunks
+
+WORDS = ["Le", "gouvernement", "annonce", "une", "réforme", "majeure", "des", "retraites", "aujourd'hui.",
+         "Selon", "les", "sources,", "le", "texte", "sera", "présenté", "https://t.co/AbCdEfGh12", "demain !"]
+
+def build_text(size, seed=0):
+    rng = random.Random(seed)
+    parts = []
+    length = 0
+    while length < size:
+        word = rng.choice(WORDS)
+        sep = rng.choices([" ", "\n", "\n\n"], weights=[30, 2, 1])[0]
+        parts.append(word + sep)
+        length += len(word) + 1
+    return "".join(parts).strip()
+
+def measure(func, text, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(text)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="2000,10000,50000")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    new = lambda text: split_text_into_chunks(text, MAX_CHAR_PER_POST, CONTINUATION_MESSAGE)
+
+    print(f"{'size':>7} {'legacy ms':>10} {'new ms':>8} {'speedup':>8} {'chunks':>7} {'max len':>8}")
+    for size in [int(s) for s in args.sizes.split(',')]:
+        text = build_text(size)
+        legacy_time, _ = measure(legacy_split_text_into_chunks, text, args.repeat)
+        new_time, chunks = measure(new, text, args.repeat)
+        longest = max(mastodon_length(chunk) for chunk in chunks)
+        print(f"{len(text):>7} {legacy_time * 1000:>10.2f} {new_time * 1000:>8.2f} {legacy_time / new_time:>7.1f}x {len(chunks):>7} {longest:>8}")
+
+if __name__ == "__main__":
+    main()
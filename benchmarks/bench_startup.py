@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# Startup benchmark: `python -X importtime -c "import <module>"` for the bot
+# and the web UI, run from an empty directory so no config.json, job
+# database or media cache is picked up. Fails (exit 1) when a module goes
+# over its budget, when it regresses more than --threshold against a saved
+# baseline, or when a module meant to be imported lazily shows up again.
+#
+#   python benchmarks/bench_startup.py [--repeat 5] [--save baseline.json]
+#   python benchmarks/bench_startup.py --baseline baseline.json [--threshold 0.25]
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Cumulative import time in milliseconds, with room for slower machines.
+BUDGETS_MS = {"bot": 300, "app": 1000}
+# Only imported when first needed (first feed parsed, first HTTP request).
+LAZY = {"bot": ["feedparser", "requests", "PIL"], "app": ["feedparser"]}
+
+def import_time(module, cwd):
+    env = dict(os.environ, PYTHONPATH=ROOT, PYTHONDONTWRITEBYTECODE="1")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=cwd, env=env, capture_output=True, text=True, check=True,
+    )
+    total = None
+    imported = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        name = name.strip()
+        imported.add(name)
+        if name == module:
+            total = int(cumulative) / 1000
+    return total, imported
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--modules", default="bot,app")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--baseline")
+    parser.add_argument("--threshold", type=float, default=0.25)
+    parser.add_argument("--save")
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    results = {}
+    failures = []
+    print(f"{'module':>8} {'median ms':>10} {'min ms':>8} {'budget':>7} {'baseline':>9}")
+    for module in args.modules.split(","):
+        times = []
+        imported = set()
+        for _ in range(args.repeat):
+            # A fresh directory each time: importing the bot creates files.
+            with tempfile.TemporaryDirectory() as cwd:
+                total, imported = import_time(module, cwd)
+            times.append(total)
+        median = statistics.median(times)
+        results[module] = median
+
+        budget = BUDGETS_MS.get(module)
+        previous = baseline.get(module)
+        print(f"{module:>8} {median:>10.1f} {min(times):>8.1f} {budget or '-':>7} {f'{previous:.1f}' if previous else '-':>9}")
+
+        if budget and median > budget:
+            failures.append(f"{module}: {median:.1f} ms > budget {budget} ms")
+        if previous and median > previous * (1 + args.threshold):
+            failures.append(f"{module}: {median:.1f} ms is {median / previous - 1:.0%} slower than the baseline ({previous:.1f} ms)")
+        eager = [name for name in LAZY.get(module, []) if name in imported]
+        if eager:
+            failures.append(f"{module}: imports {', '.join(eager)} at startup")
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
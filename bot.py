@@ -1,435 +1,1076 @@
 #!/usr/bin/env python3
-import feedparser
-import requests
 import time
+import hashlib
+import threading
+import contextvars
 import json
+import logging
+import multiprocessing
 import os
-import re
-import html as html_module
-from datetime import datetime
+import queue
 from io import BytesIO
-import shutil
+from datetime import datetime
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+import http_client
+import logs
+from description_parser import parse_description
+from text_splitter import split_text_into_chunks, URL_LENGTH
+from dedup_store import DedupStore
+from job_queue import JobQueue, job_key
+from scheduler import Scheduler
+from polling import entry_timestamp, posting_cadence, poll_interval, budget_factor, jittered, CADENCE_SAMPLES
+from feed_parser import parse_feed, Feed
+from metrics import registry
+from rate_limit import limiter
+from media_cache import MediaCache
+from media_stream import spool_media, media_filename, MediaTooLarge, MultipartFile
+import media_optimize
 
 MASTODON_URL = os.getenv("MASTODON_URL", "https://mastodon.social")
 MASTODON_TOKEN = os.getenv("MASTODON_TOKEN", "")
 RSSHUB_URL = os.getenv("RSSHUB_URL", "http://host.docker.internal:1200/twitter/user/L_ThinkTank")
 TWITTER_ACCOUNT = "L_ThinkTank"
 CACHE_FILE = "posted_urls.json"
+CACHE_RETENTION_DAYS = 0
 CHECK_INTERVAL = 1800
+MIN_CHECK_INTERVAL = 120
+MAX_CHECK_INTERVAL = 3600
+CHECK_JITTER = 0.1
+FETCH_BUDGET = 0
 AUTO_DELETE_DELAY = 30
+ANNOUNCE_MIN_INTERVAL = 600
 AUTODESTRUCT_VIDEO_URL = "https://media.giphy.com/media/7G9jJdKhlCrED7vEvT/giphy.mp4"
 MAX_CHAR_PER_POST = 490
 STARTUP_MESSAGE_TEMPLATE = "🤖 Bot démarrage: {HEURE}\n📡 Surveillance: @{TWITTER_ACCOUNT}\n⏰ Auto-suppression dans {DELAY}s"
 CONTINUATION_MESSAGE = "[La suite dans les commentaires 👇]"
+MAX_WORKERS = 4
+MEDIA_WORKERS = 4
+MAX_MEDIA_SIZE = 40 * 1024 * 1024
+MEDIA_UPLOAD_TIMEOUT = 300
+RATE_LIMIT_RETRIES = 3
+MAX_MEDIA_ATTACHMENTS = 4
+MEDIA_PROCESSING_TIMEOUT = 120
+MEDIA_CACHE_DIR = "media_cache"
+MEDIA_CACHE_SIZE = 200 * 1024 * 1024
+MEDIA_ID_TTL = 6 * 3600
+MEDIA_OPTIMIZE = False
+MEDIA_PROCESSES = 2
+MEDIA_MAX_PIXELS = 0
+MEDIA_VIDEO_RESOLUTION = 720
+# Mastodon 4.x defaults, used when the instance doesn't report its own.
+MEDIA_LIMITS = {"image_size_limit": 16 * 1024 * 1024, "image_matrix_limit": 33177600, "video_size_limit": 99 * 1024 * 1024}
+JOBS_DB = "jobs/jobs.db"
+JOB_MAX_ATTEMPTS = 5
+POST_QUEUE_SIZE = 4
+DISPATCH_INTERVAL = 60
+CATCHUP_BATCH = 10
+METRICS_FILE = "metrics.prom"
+METRICS_INTERVAL = 15
+MAINTENANCE_INTERVAL = 3600
+INSTANCE_RETRY = 300
+INGEST_SECRET = ""
+WEBSUB_CALLBACK_URL = ""
+WEBSUB_LEASE = 86400
+PUSH_POLL_INTERVAL = 6 * 3600
+PUSH_TIMEOUT = 86400
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", logs.LEVEL)
+LOG_FORMAT = os.getenv("LOG_FORMAT", logs.FORMAT)
+
+log = logging.getLogger(__name__)
+logs.setup(LOG_LEVEL, LOG_FORMAT)
 
 def load_config_from_file():
     if os.path.exists("config.json"):
         try:
             with open("config.json", 'r') as f:
                 config = json.load(f)
-                print(f"[CONFIG] ✅ Config chargée depuis config.json")
+                log.info(f"[CONFIG] ✅ Config chargée depuis config.json")
                 return config
         except Exception as e:
-            print(f"[CONFIG] ❌ Erreur lecture config.json: {e}")
+            log.error(f"[CONFIG] ❌ Erreur lecture config.json: {e}")
     return None
 
 config_from_file = load_config_from_file()
-if config_from_file:
-    MASTODON_URL = config_from_file.get("MASTODON_URL", MASTODON_URL)
-    MASTODON_TOKEN = config_from_file.get("MASTODON_TOKEN", MASTODON_TOKEN)
-    RSSHUB_URL = config_from_file.get("RSSHUB_URL", RSSHUB_URL)
-    TWITTER_ACCOUNT = config_from_file.get("TWITTER_ACCOUNT", TWITTER_ACCOUNT)
-    CHECK_INTERVAL = int(config_from_file.get("CHECK_INTERVAL", CHECK_INTERVAL))
-    AUTO_DELETE_DELAY = int(config_from_file.get("AUTO_DELETE_DELAY", AUTO_DELETE_DELAY))
-    AUTODESTRUCT_VIDEO_URL = config_from_file.get("AUTODESTRUCT_VIDEO_URL", AUTODESTRUCT_VIDEO_URL)
-    MAX_CHAR_PER_POST = int(config_from_file.get("MAX_CHAR_PER_POST", MAX_CHAR_PER_POST))
-    STARTUP_MESSAGE_TEMPLATE = config_from_file.get("STARTUP_MESSAGE_TEMPLATE", STARTUP_MESSAGE_TEMPLATE)
-    CONTINUATION_MESSAGE = config_from_file.get("CONTINUATION_MESSAGE", CONTINUATION_MESSAGE)
-
-def load_cache():
-    if os.path.exists(CACHE_FILE):
-        try:
-            if os.path.isfile(CACHE_FILE):
-                return json.load(open(CACHE_FILE))
-            elif os.path.isdir(CACHE_FILE):
-                print(f"[CACHE] ⚠️ {CACHE_FILE} est un dossier, suppression...")
-                shutil.rmtree(CACHE_FILE)
-                return []
-        except Exception as e:
-            print(f"[CACHE] ❌ Erreur lecture cache: {e}")
-            return []
-    return []
+media_cache = None
+media_pool = None
+optimize_pool = None
+jobs = None
+resource_settings = {}
 
-def save_cache(urls):
-    try:
-        if os.path.exists(CACHE_FILE) and os.path.isdir(CACHE_FILE):
-            print(f"[CACHE] ⚠️ Suppression du dossier {CACHE_FILE}...")
-            shutil.rmtree(CACHE_FILE)
-        json.dump(urls, open(CACHE_FILE, "w"))
-    except Exception as e:
-        print(f"[CACHE] ❌ Erreur écriture cache: {e}")
+def apply_config(config):
+    # Called at import and again when the web UI saves config.json, so a
+    # running bot picks up new settings without a restart.
+    global config_from_file, media_cache, media_pool, optimize_pool, jobs
+    global MASTODON_URL, MASTODON_TOKEN, RSSHUB_URL, TWITTER_ACCOUNT, CHECK_INTERVAL, MIN_CHECK_INTERVAL, MAX_CHECK_INTERVAL, CHECK_JITTER, FETCH_BUDGET, AUTO_DELETE_DELAY, ANNOUNCE_MIN_INTERVAL, AUTODESTRUCT_VIDEO_URL, MAX_CHAR_PER_POST, STARTUP_MESSAGE_TEMPLATE
+    global CONTINUATION_MESSAGE, CACHE_RETENTION_DAYS, MAX_WORKERS, MEDIA_WORKERS, MAX_MEDIA_SIZE, MEDIA_UPLOAD_TIMEOUT, RATE_LIMIT_RETRIES, MEDIA_PROCESSING_TIMEOUT, MEDIA_CACHE_DIR, MEDIA_CACHE_SIZE, MEDIA_ID_TTL, JOBS_DB
+    global JOB_MAX_ATTEMPTS, POST_QUEUE_SIZE, CATCHUP_BATCH, METRICS_FILE, LOG_LEVEL, LOG_FORMAT
+    global MEDIA_OPTIMIZE, MEDIA_PROCESSES, MEDIA_MAX_PIXELS, MEDIA_VIDEO_RESOLUTION
+    global INGEST_SECRET, WEBSUB_CALLBACK_URL, WEBSUB_LEASE, PUSH_POLL_INTERVAL, PUSH_TIMEOUT
+    config_from_file = config
+    if config:
+        MASTODON_URL = config.get("MASTODON_URL", MASTODON_URL)
+        MASTODON_TOKEN = config.get("MASTODON_TOKEN", MASTODON_TOKEN)
+        RSSHUB_URL = config.get("RSSHUB_URL", RSSHUB_URL)
+        TWITTER_ACCOUNT = config.get("TWITTER_ACCOUNT", TWITTER_ACCOUNT)
+        CHECK_INTERVAL = int(config.get("CHECK_INTERVAL", CHECK_INTERVAL))
+        MIN_CHECK_INTERVAL = int(config.get("MIN_CHECK_INTERVAL", MIN_CHECK_INTERVAL))
+        MAX_CHECK_INTERVAL = int(config.get("MAX_CHECK_INTERVAL", MAX_CHECK_INTERVAL))
+        CHECK_JITTER = float(config.get("CHECK_JITTER", CHECK_JITTER))
+        FETCH_BUDGET = float(config.get("FETCH_BUDGET", FETCH_BUDGET))
+        AUTO_DELETE_DELAY = int(config.get("AUTO_DELETE_DELAY", AUTO_DELETE_DELAY))
+        ANNOUNCE_MIN_INTERVAL = int(config.get("ANNOUNCE_MIN_INTERVAL", ANNOUNCE_MIN_INTERVAL))
+        AUTODESTRUCT_VIDEO_URL = config.get("AUTODESTRUCT_VIDEO_URL", AUTODESTRUCT_VIDEO_URL)
+        MAX_CHAR_PER_POST = int(config.get("MAX_CHAR_PER_POST", MAX_CHAR_PER_POST))
+        STARTUP_MESSAGE_TEMPLATE = config.get("STARTUP_MESSAGE_TEMPLATE", STARTUP_MESSAGE_TEMPLATE)
+        CONTINUATION_MESSAGE = config.get("CONTINUATION_MESSAGE", CONTINUATION_MESSAGE)
+        CACHE_RETENTION_DAYS = int(config.get("CACHE_RETENTION_DAYS", CACHE_RETENTION_DAYS))
+        MAX_WORKERS = int(config.get("MAX_WORKERS", MAX_WORKERS))
+        MEDIA_WORKERS = int(config.get("MEDIA_WORKERS", MEDIA_WORKERS))
+        MAX_MEDIA_SIZE = int(config.get("MAX_MEDIA_SIZE", MAX_MEDIA_SIZE))
+        MEDIA_UPLOAD_TIMEOUT = int(config.get("MEDIA_UPLOAD_TIMEOUT", MEDIA_UPLOAD_TIMEOUT))
+        RATE_LIMIT_RETRIES = int(config.get("RATE_LIMIT_RETRIES", RATE_LIMIT_RETRIES))
+        MEDIA_PROCESSING_TIMEOUT = int(config.get("MEDIA_PROCESSING_TIMEOUT", MEDIA_PROCESSING_TIMEOUT))
+        MEDIA_CACHE_DIR = config.get("MEDIA_CACHE_DIR", MEDIA_CACHE_DIR)
+        MEDIA_CACHE_SIZE = int(config.get("MEDIA_CACHE_SIZE", MEDIA_CACHE_SIZE))
+        MEDIA_ID_TTL = int(config.get("MEDIA_ID_TTL", MEDIA_ID_TTL))
+        MEDIA_OPTIMIZE = str(config.get("MEDIA_OPTIMIZE", MEDIA_OPTIMIZE)).lower() in ("1", "true", "yes")
+        MEDIA_PROCESSES = int(config.get("MEDIA_PROCESSES", MEDIA_PROCESSES))
+        MEDIA_MAX_PIXELS = int(config.get("MEDIA_MAX_PIXELS", MEDIA_MAX_PIXELS))
+        MEDIA_VIDEO_RESOLUTION = int(config.get("MEDIA_VIDEO_RESOLUTION", MEDIA_VIDEO_RESOLUTION))
+        JOBS_DB = config.get("JOBS_DB", JOBS_DB)
+        JOB_MAX_ATTEMPTS = int(config.get("JOB_MAX_ATTEMPTS", JOB_MAX_ATTEMPTS))
+        POST_QUEUE_SIZE = int(config.get("POST_QUEUE_SIZE", POST_QUEUE_SIZE))
+        CATCHUP_BATCH = int(config.get("CATCHUP_BATCH", CATCHUP_BATCH))
+        METRICS_FILE = config.get("METRICS_FILE", METRICS_FILE)
+        INGEST_SECRET = config.get("INGEST_SECRET", INGEST_SECRET)
+        WEBSUB_CALLBACK_URL = config.get("WEBSUB_CALLBACK_URL", WEBSUB_CALLBACK_URL)
+        WEBSUB_LEASE = int(config.get("WEBSUB_LEASE", WEBSUB_LEASE))
+        PUSH_POLL_INTERVAL = int(config.get("PUSH_POLL_INTERVAL", PUSH_POLL_INTERVAL))
+        PUSH_TIMEOUT = int(config.get("PUSH_TIMEOUT", PUSH_TIMEOUT))
+        LOG_LEVEL = config.get("LOG_LEVEL", LOG_LEVEL)
+        LOG_FORMAT = config.get("LOG_FORMAT", LOG_FORMAT)
+        logs.setup(LOG_LEVEL, LOG_FORMAT)
+        http_client.configure(config)
+    
+    # Shared resources are only rebuilt when their own settings changed.
+    if resource_settings.get("media_cache") != (MEDIA_CACHE_DIR, MEDIA_CACHE_SIZE, MEDIA_ID_TTL):
+        resource_settings["media_cache"] = (MEDIA_CACHE_DIR, MEDIA_CACHE_SIZE, MEDIA_ID_TTL)
+        media_cache = MediaCache(MEDIA_CACHE_DIR, MEDIA_CACHE_SIZE, MEDIA_ID_TTL) if MEDIA_CACHE_SIZE > 0 else None
+    if resource_settings.get("media_pool") != MEDIA_WORKERS:
+        resource_settings["media_pool"] = MEDIA_WORKERS
+        if media_pool:
+            media_pool.shutdown(wait=False)
+        media_pool = ThreadPoolExecutor(max_workers=MEDIA_WORKERS, thread_name_prefix="media")
+    if resource_settings.get("optimize_pool") != (MEDIA_OPTIMIZE, MEDIA_PROCESSES):
+        resource_settings["optimize_pool"] = (MEDIA_OPTIMIZE, MEDIA_PROCESSES)
+        if optimize_pool:
+            optimize_pool.shutdown(wait=False)
+        optimize_pool = None
+        if MEDIA_OPTIMIZE and not media_optimize.pillow_available():
+            log.warning("[MEDIA] ⚠️ MEDIA_OPTIMIZE activé mais Pillow n'est pas installé, images envoyées telles quelles")
+        elif MEDIA_OPTIMIZE:
+            # Re-encoding is CPU-bound: separate processes keep it off the GIL
+            # shared with polling and posting. Spawned, not forked: the workers
+            # start from a media thread while the log writer, scheduler and
+            # Flask threads may hold locks a fork would copy.
+            optimize_pool = ProcessPoolExecutor(max_workers=MEDIA_PROCESSES, mp_context=multiprocessing.get_context("spawn"))
+    if resource_settings.get("jobs") != (JOBS_DB, JOB_MAX_ATTEMPTS):
+        resource_settings["jobs"] = (JOBS_DB, JOB_MAX_ATTEMPTS)
+        jobs = JobQueue(JOBS_DB, JOB_MAX_ATTEMPTS)
+
+apply_config(config_from_file)
 
-def extract_media_from_description(description_html):
-    media_urls = {
-        'videos': [],
-        'images': []
+# Mastodon URL -> (configuration, retry time or None once fetched).
+instance_configs = {}
+instance_lock = threading.Lock()
+in_flight = set()
+post_queues = {}
+# Feeds, dedup store and dispatcher wakeups of the running start_bot(), for
+# entries pushed to the web UI.
+active_run = {}
+scheduler = Scheduler()
+scheduled_deletions = set()
+
+FETCH_SECONDS = registry.histogram("rss_bot_fetch_seconds", "RSSHub request duration", ["feed"])
+FETCHES = registry.counter("rss_bot_fetches_total", "Feed checks by result", ["feed", "result"])
+PARSE_SECONDS = registry.histogram("rss_bot_parse_seconds", "Feed parsing duration", ["feed"])
+PARSES = registry.counter("rss_bot_parses_total", "Parsed feeds by parser (stream stopped early, stream full, feedparser)", ["feed", "parser"])
+DESCRIPTION_SECONDS = registry.histogram("rss_bot_description_seconds", "parse_description duration (text and media)")
+MEDIA_DOWNLOAD_SECONDS = registry.histogram("rss_bot_media_download_seconds", "Media download duration", ["type"])
+MEDIA_UPLOAD_SECONDS = registry.histogram("rss_bot_media_upload_seconds", "Media upload duration, processing included", ["type"])
+MEDIA = registry.counter("rss_bot_media_total", "Media by result", ["type", "result"])
+MEDIA_OPTIMIZE_SECONDS = registry.histogram("rss_bot_media_optimize_seconds", "Image resize and re-encode duration")
+MEDIA_CACHE = registry.counter("rss_bot_media_cache_total", "Media cache lookups", ["result"])
+POST_SECONDS = registry.histogram("rss_bot_post_seconds", "POST /api/v1/statuses duration")
+POSTS = registry.counter("rss_bot_posts_total", "Mastodon statuses by result", ["result"])
+MASTODON_RESPONSES = registry.counter("rss_bot_mastodon_responses_total", "Mastodon API responses by status code", ["endpoint", "status"])
+RETRIES = registry.counter("rss_bot_retries_total", "Retries by reason", ["reason"])
+JOBS_DONE = registry.counter("rss_bot_jobs_total", "Queued tweets finished, by result", ["feed", "result"])
+registry.gauge("rss_bot_jobs_pending", "Tweets waiting in the job queue", callback=lambda: [({}, len(jobs))])
+registry.gauge("rss_bot_jobs_in_flight", "Tweets dispatched and not finished yet", callback=lambda: [({}, len(in_flight))])
+registry.gauge("rss_bot_post_queue_depth", "Tweets waiting for the account's poster", ["account"], callback=lambda: [({"account": account}, q.qsize()) for account, q in list(post_queues.items())])
+
+def load_feeds():
+    defaults = {
+        "NAME": TWITTER_ACCOUNT,
+        "RSSHUB_URL": RSSHUB_URL,
+        "TWITTER_ACCOUNT": TWITTER_ACCOUNT,
+        "MASTODON_URL": MASTODON_URL,
+        "MASTODON_TOKEN": MASTODON_TOKEN,
+        "CHECK_INTERVAL": CHECK_INTERVAL,
+        "MIN_CHECK_INTERVAL": MIN_CHECK_INTERVAL,
+        "MAX_CHECK_INTERVAL": MAX_CHECK_INTERVAL,
     }
+    feeds_config = (config_from_file or {}).get("FEEDS") or [{}]
     
-    if not description_html:
-        return []
-    
-    description_decoded = html_module.unescape(description_html)
-    
-    video_pattern = r'(?:https?://(?:video|cdn)\.twimg\.com/[^\s<>"]+\.(?:mp4|webm|mov|m3u8))'
-    video_urls = re.findall(video_pattern, description_decoded, re.IGNORECASE)
-    for url in video_urls:
-        url = html_module.unescape(url)
-        url = url.split('?')[0]
-        if url and url not in media_urls['videos']:
-            media_urls['videos'].append(url)
-    
-    img_pattern = r'<img[^>]+src=["\']([^"\']+)["\']'
-    img_urls = re.findall(img_pattern, description_decoded)
-    for url in img_urls:
-        url = html_module.unescape(url)
-        if url and url not in media_urls['images']:
-            media_urls['images'].append(url)
-    
-    media_pattern = r'<a[^>]+href=["\']([^"\']+\.(?:jpg|jpeg|png|gif))["\']'
-    media_urls_found = re.findall(media_pattern, description_decoded, re.IGNORECASE)
-    for url in media_urls_found:
-        url = html_module.unescape(url)
-        if url and url not in media_urls['images']:
-            media_urls['images'].append(url)
-    
-    img_src_pattern = r'(?:https?://pbs\.twimg\.com/media/[^\s<>"]+\.(?:jpg|jpeg|png|gif))'
-    img_src_urls = re.findall(img_src_pattern, description_decoded, re.IGNORECASE)
-    for url in img_src_urls:
-        url = html_module.unescape(url)
-        url = url.split('?')[0]
-        if url and url not in media_urls['images']:
-            media_urls['images'].append(url)
-    
-    result = media_urls['videos'] + media_urls['images']
+    feeds = []
+    for feed_config in feeds_config:
+        feed = dict(defaults)
+        feed.update(feed_config)
+        if "NAME" not in feed_config:
+            feed["NAME"] = feed["TWITTER_ACCOUNT"]
+        feed["CHECK_INTERVAL"] = int(feed["CHECK_INTERVAL"])
+        # The configured interval is where polling starts and always stays
+        # within the bounds; MIN = MAX turns the adaptive interval off.
+        feed["MIN_CHECK_INTERVAL"] = min(int(feed["MIN_CHECK_INTERVAL"]), feed["CHECK_INTERVAL"])
+        feed["MAX_CHECK_INTERVAL"] = max(int(feed["MAX_CHECK_INTERVAL"]), feed["CHECK_INTERVAL"])
+        feeds.append(feed)
+    # The NAME keys the watermark, the jobs and the dispatcher of a feed: two
+    # feeds mirroring the same account to two targets need distinct NAMEs.
+    names = [feed["NAME"] for feed in feeds]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"FEEDS: NAME en double ({', '.join(duplicates)}), donnez un NAME distinct à chaque flux")
+    return feeds
+
+def mastodon_request(feed, bucket, method, path, **kwargs):
+    key = (feed["MASTODON_URL"], feed["MASTODON_TOKEN"], bucket)
+    body = kwargs.get("data")
+    for attempt in range(RATE_LIMIT_RETRIES + 1):
+        if attempt and hasattr(body, "rewind"):
+            body.rewind()
+        limiter.acquire(key)
+        r = method(f"{feed['MASTODON_URL']}{path}", **kwargs)
+        MASTODON_RESPONSES.inc(endpoint=bucket, status=r.status_code)
+        if not limiter.update(key, r):
+            return r
+        RETRIES.inc(reason="rate_limit")
+        log.warning(f"[RATE] ⚠️ 429 on {path}, retry {attempt + 1}/{RATE_LIMIT_RETRIES}")
+    return r
+
+def get_instance_config(feed):
+    # A failed lookup (no /api/v2/instance before Mastodon 4, errors) is
+    # cached empty for INSTANCE_RETRY seconds, so posting uses the defaults
+    # instead of asking again for every post. The request is made outside
+    # the lock: media workers don't queue up behind it.
+    mastodon_url = feed["MASTODON_URL"]
+    with instance_lock:
+        cached = instance_configs.get(mastodon_url)
+    if cached and (cached[1] is None or cached[1] > time.time()):
+        return cached[0]
+    config, expires = {}, time.time() + INSTANCE_RETRY
+    try:
+        r = http_client.get(f"{mastodon_url}/api/v2/instance")
+        if r.status_code == 200:
+            config, expires = r.json().get("configuration", {}), None
+        else:
+            log.warning(f"[INSTANCE] ⚠️ {r.status_code}")
+    except Exception as e:
+        log.warning(f"[INSTANCE] ⚠️ {e}")
+    with instance_lock:
+        instance_configs[mastodon_url] = (config, expires)
+    return config
+
+def max_characters(feed):
+    statuses = get_instance_config(feed).get("statuses", {})
+    return int(statuses.get("max_characters", MAX_CHAR_PER_POST))
+
+def characters_per_url(feed):
+    statuses = get_instance_config(feed).get("statuses", {})
+    return int(statuses.get("characters_reserved_per_url", URL_LENGTH))
+
+def max_media_attachments(feed):
+    statuses = get_instance_config(feed).get("statuses", {})
+    return int(statuses.get("max_media_attachments", MAX_MEDIA_ATTACHMENTS))
+
+def media_limits(feed):
+    limits = dict(MEDIA_LIMITS)
+    reported = get_instance_config(feed).get("media_attachments", {})
+    limits.update((key, int(reported[key])) for key in limits if key in reported)
+    return limits
+
+def optimize_image(fileobj, limits, url):
+    # Resized/re-encoded copy of an image over the instance limits (or over
+    # MEDIA_MAX_PIXELS), or None to upload the original.
+    if not optimize_pool:
+        return None
+    max_pixels = min(MEDIA_MAX_PIXELS or limits["image_matrix_limit"], limits["image_matrix_limit"])
+    data = fileobj.read()
+    fileobj.seek(0)
+    try:
+        with MEDIA_OPTIMIZE_SECONDS.time():
+            result = optimize_pool.submit(media_optimize.optimize_image, data, limits["image_size_limit"], max_pixels).result()
+    except Exception as e:
+        log.warning(f"[MEDIA] ⚠️ Optimisation impossible: {str(e)[:100]}")
+        return None
+    if result:
+        log.info(f"[MEDIA] 🗜️ Image optimisée: {len(data) // 1024} Ko -> {len(result[0]) // 1024} Ko ({url[:50]})")
     return result
 
-def clean_description(description_html):
-    if not description_html:
-        return ""
-    
-    text = re.sub(r'<(?:div|blockquote|span)[^>]*class="rsshub-quote"[^>]*>.*?</(?:div|blockquote|span)>', '', description_html, flags=re.DOTALL)
-    text = text.replace('<br/>', '\n').replace('<br>', '\n').replace('<br />', '\n')
-    text = re.sub(r'<img[^>]*>', '', text)
-    text = re.sub(r'<a[^>]*>', '', text)
-    text = re.sub(r'</a>', '', text)
-    text = re.sub('<[^<]+?>', '', text)
-    text = html_module.unescape(text)
-    
-    lines = text.split('\n')
-    text = '\n'.join([' '.join(line.split()) for line in lines])
-    
-    text = text.strip()
-    text = text.encode('utf-8', errors='ignore').decode('utf-8')
-    
-    return text
+def wait_for_media(feed, media_id):
+    headers = {"Authorization": f"Bearer {feed['MASTODON_TOKEN']}"}
+    deadline = time.monotonic() + MEDIA_PROCESSING_TIMEOUT
+    delay = 1
+    while time.monotonic() < deadline:
+        time.sleep(delay)
+        r = mastodon_request(feed, "api", http_client.get, f"/api/v1/media/{media_id}", headers=headers)
+        if r.status_code == 200:
+            log.info(f"[MEDIA] ✅ Processed: {media_id}")
+            return media_id
+        if r.status_code != 206:
+            log.error(f"[MEDIA] ❌ Processing failed: {r.status_code}")
+            return None
+        delay = min(delay * 2, 5)
+    log.error(f"[MEDIA] ❌ Processing timeout: {media_id}")
+    return None
 
-def split_text_into_chunks(text, max_length=MAX_CHAR_PER_POST):
-    if len(text) <= max_length:
-        return [text]
+def fetch_media(url, max_size=MAX_MEDIA_SIZE):
+    if media_cache:
+        cached = media_cache.lookup(url)
+        if cached:
+            MEDIA_CACHE.inc(result="hit")
+            log.debug(f"[MEDIA] 💾 Cache hit: {url[:60]}")
+            return cached
+        MEDIA_CACHE.inc(result="miss")
     
-    chunks = []
-    current_chunk = ""
-    
-    i = 0
-    while i < len(text):
-        if len(current_chunk) < max_length - 30:
-            current_chunk += text[i]
-            i += 1
-        else:
-            last_newline = current_chunk.rfind('\n')
-            if last_newline > max_length * 0.7:
-                chunk_to_save = current_chunk[:last_newline].strip()
-                remaining = current_chunk[last_newline:].strip()
-                if chunk_to_save:
-                    chunks.append(chunk_to_save + "\n\n" + CONTINUATION_MESSAGE)
-                current_chunk = remaining
-            else:
-                last_space = current_chunk.rfind(' ')
-                if last_space > max_length * 0.6:
-                    chunk_to_save = current_chunk[:last_space].strip()
-                    remaining = current_chunk[last_space:].strip()
-                    if chunk_to_save:
-                        chunks.append(chunk_to_save + "\n\n" + CONTINUATION_MESSAGE)
-                    current_chunk = remaining
-                else:
-                    if current_chunk:
-                        chunks.append(current_chunk.strip() + "\n\n" + CONTINUATION_MESSAGE)
-                    current_chunk = ""
+    r = http_client.get(url, stream=True)
+    try:
+        if r.status_code != 200:
+            log.error(f"[MEDIA] ❌ Download failed: {r.status_code}")
+            return None
+        if media_cache:
+            return media_cache.put(url, r, max_size)
+        return spool_media(r, max_size)
+    finally:
+        r.close()
+
+def upload_media(url, feed):
+    # Guessed from the URL until the download tells the Content-Type.
+    if 'video.twimg.com' in url or 'cdn.twimg.com' in url:
+        media_type = "VIDEO"
+    else:
+        media_type = "IMAGE"
     
-    if current_chunk.strip():
-        chunks.append(current_chunk.strip())
+    limits = media_limits(feed)
+    # Media over every instance limit are dropped while downloading instead
+    # of being rejected after a full upload.
+    max_size = min(MAX_MEDIA_SIZE, max(limits["video_size_limit"], limits["image_size_limit"]))
     
-    return chunks
-
-def upload_media(url):
     try:
-        if 'video.twimg.com' in url or 'cdn.twimg.com' in url:
-            media_type = "VIDEO"
-        else:
-            media_type = "IMAGE"
+        log.debug(f"[MEDIA] Downloading {media_type}: {url[:60]}")
+        try:
+            with MEDIA_DOWNLOAD_SECONDS.time(type=media_type):
+                media = fetch_media(url, max_size)
+        except MediaTooLarge as e:
+            MEDIA.inc(type=media_type, result="too_large")
+            log.warning(f"[MEDIA] ⚠️ Too large ({e}): {url[:50]}")
+            return None
+        if not media:
+            MEDIA.inc(type=media_type, result="download_failed")
+            return None
         
-        print(f"[MEDIA] Downloading {media_type}: {url[:60]}")
-        r = requests.get(url, timeout=15)
-        if r.status_code == 200:
-            headers = {"Authorization": f"Bearer {MASTODON_TOKEN}"}
-            files = {"file": BytesIO(r.content)}
-            resp = requests.post(f"{MASTODON_URL}/api/v1/media", headers=headers, files=files)
-            if resp.status_code == 200:
-                media_id = resp.json()["id"]
-                print(f"[MEDIA] ✅ {media_type} uploaded: {media_id}")
-                time.sleep(1)
-                return media_id
-            elif resp.status_code == 429:
-                print(f"[MEDIA] ⚠️ Rate limit (429), waiting 5 seconds...")
-                time.sleep(5)
-                return None
-            elif resp.status_code == 422:
-                print(f"[MEDIA] ⚠️ Rejected (422): {url[:50]}")
+        digest, info, fileobj = media
+        with fileobj:
+            if media_cache:
+                media_id = media_cache.take_media_id(feed, digest)
+                if media_id:
+                    MEDIA.inc(type=media_type, result="reused")
+                    log.info(f"[MEDIA] ♻️ {media_type} reused: {media_id}")
+                    return media_id
+            
+            filename, content_type, size = media_filename(url), info["content_type"], info["size"]
+            if content_type.startswith("video/"):
+                media_type = "VIDEO"
+            elif content_type.startswith("image/"):
+                media_type = "IMAGE"
+            size_limit = limits["video_size_limit"] if media_type == "VIDEO" else limits["image_size_limit"]
+            optimized = optimize_image(fileobj, limits, url) if content_type.startswith("image/") else None
+            if optimized:
+                MEDIA.inc(type=media_type, result="optimized")
+                data, content_type = optimized
+                fileobj, size = BytesIO(data), len(data)
+                filename = os.path.splitext(filename)[0] + (".png" if content_type == "image/png" else ".jpg")
+            elif size > size_limit:
+                # Cached under a larger limit, or an image Pillow couldn't shrink.
+                MEDIA.inc(type=media_type, result="too_large")
+                log.warning(f"[MEDIA] ⚠️ Too large for the instance ({size} > {size_limit}): {url[:50]}")
                 return None
-            else:
-                print(f"[MEDIA] ❌ Upload failed: {resp.status_code}")
+            
+            body = MultipartFile(fileobj, size, filename, content_type)
+            headers = {"Authorization": f"Bearer {feed['MASTODON_TOKEN']}", "Content-Type": body.content_type}
+            upload_start = time.perf_counter()
+            resp = mastodon_request(feed, "media", http_client.post, "/api/v2/media", headers=headers, data=body, timeout=(http_client.CONNECT_TIMEOUT, MEDIA_UPLOAD_TIMEOUT))
+        
+        media_id = None
+        if resp.status_code == 200:
+            media_id = resp.json()["id"]
+            log.info(f"[MEDIA] ✅ {media_type} uploaded: {media_id}")
+        elif resp.status_code == 202:
+            log.debug(f"[MEDIA] ⏳ {media_type} processing: {resp.json()['id']}")
+            media_id = wait_for_media(feed, resp.json()["id"])
+        elif resp.status_code == 429:
+            # Retries are used up: the whole job waits and retries later
+            # rather than being posted without this media.
+            MEDIA.inc(type=media_type, result="rate_limited")
+            log.warning(f"[MEDIA] ⚠️ Rate limit (429), tweet reporté: {url[:50]}")
+            raise MediaRateLimited(url)
+        elif resp.status_code == 422:
+            log.warning(f"[MEDIA] ⚠️ Rejected (422): {url[:50]}")
         else:
-            print(f"[MEDIA] ❌ Download failed: {r.status_code}")
-        return None
+            log.error(f"[MEDIA] ❌ Upload failed: {resp.status_code}")
+        
+        MEDIA_UPLOAD_SECONDS.observe(time.perf_counter() - upload_start, type=media_type)
+        MEDIA.inc(type=media_type, result="uploaded" if media_id else "upload_failed")
+        if media_id and media_cache:
+            media_cache.uploaded(feed, digest, media_id)
+        return media_id
+    except MediaRateLimited:
+        raise
     except Exception as e:
-        print(f"[MEDIA] ❌ Error: {str(e)[:100]}")
+        MEDIA.inc(type=media_type, result="error")
+        log.error(f"[MEDIA] ❌ Error: {str(e)[:100]}")
         return None
 
-def post_to_mastodon(text, media_ids=None, reply_to_id=None):
-    headers = {"Authorization": f"Bearer {MASTODON_TOKEN}", "Content-Type": "application/json"}
+def release_media(media_ids, attached):
+    if media_cache and media_ids:
+        media_cache.attached(attached)
+        media_cache.release([m for m in media_ids if m not in attached])
+
+def post_to_mastodon(text, feed, media_ids=None, reply_to_id=None, idempotency_key=None):
+    headers = {"Authorization": f"Bearer {feed['MASTODON_TOKEN']}", "Content-Type": "application/json"}
+    if idempotency_key:
+        # Mastodon answers a repeated key with the status it already created,
+        # so a post resent after a crash or a lost response is not duplicated.
+        headers["Idempotency-Key"] = idempotency_key
     
     valid_media_ids = [m for m in (media_ids or []) if m]
     
     text = text.strip()
     if not text:
-        print(f"[POST] ❌ Empty text")
+        log.error(f"[POST] ❌ Empty text")
+        release_media(valid_media_ids, [])
         return None
     
     data = {"status": text, "visibility": "public"}
     if reply_to_id:
         data["in_reply_to_id"] = reply_to_id
     
-    if valid_media_ids and len(valid_media_ids) > 0:
-        print(f"[POST] Using first media (priority video)...")
-        data["media_ids"] = [valid_media_ids[0]]
+    attachments = []
+    if valid_media_ids:
+        attachments.append(valid_media_ids[:max_media_attachments(feed)])
+        if len(attachments[0]) > 1:
+            # Mastodon refuses a video mixed with images: fall back to the
+            # first media (the video, if any) before posting without media.
+            attachments.append(valid_media_ids[:1])
+    
+    for media_group in attachments:
+        log.debug(f"[POST] Using {len(media_group)} media(s) (priority video)...")
+        data["media_ids"] = media_group
         try:
-            r = requests.post(f"{MASTODON_URL}/api/v1/statuses", headers=headers, json=data)
+            with POST_SECONDS.time():
+                r = mastodon_request(feed, "statuses", http_client.post, "/api/v1/statuses", headers=headers, json=data)
             if r.status_code == 200:
                 status_id = r.json()["id"]
-                print(f"[POST] ✅ Posted (ID: {status_id}) + 1 MEDIA")
+                POSTS.inc(result="posted")
+                log.info(f"[POST] ✅ Posted (ID: {status_id}) + {len(media_group)} MEDIA")
+                release_media(valid_media_ids, media_group)
                 return status_id
             elif r.status_code == 422:
-                print(f"[POST] ⚠️ 422 with media, trying without...")
+                RETRIES.inc(reason="media_422")
+                log.warning(f"[POST] ⚠️ 422 with {len(media_group)} media(s), retrying...")
         except Exception as e:
-            print(f"[POST] ⚠️ Error with media: {e}")
+            log.warning(f"[POST] ⚠️ Error with media: {e}")
     
     data.pop("media_ids", None)
+    release_media(valid_media_ids, [])
     try:
-        r = requests.post(f"{MASTODON_URL}/api/v1/statuses", headers=headers, json=data)
+        with POST_SECONDS.time():
+            r = mastodon_request(feed, "statuses", http_client.post, "/api/v1/statuses", headers=headers, json=data)
         if r.status_code == 200:
             status_id = r.json()["id"]
+            POSTS.inc(result="posted")
             reply_info = " [Reply]" if reply_to_id else ""
-            print(f"[POST] ✅ Posted (ID: {status_id}){reply_info}: {text[:40]}")
+            log.info(f"[POST] ✅ Posted (ID: {status_id}){reply_info}: {text[:40]}")
             return status_id
         elif r.status_code == 422:
-            print(f"[POST] ❌ Failed 422")
+            POSTS.inc(result="rejected")
+            log.error(f"[POST] ❌ Failed 422")
             return None
-        print(f"[POST] ❌ Failed: {r.status_code}")
+        POSTS.inc(result="failed")
+        log.error(f"[POST] ❌ Failed: {r.status_code}")
         return None
     except Exception as e:
-        print(f"[POST] ❌ Error: {e}")
+        POSTS.inc(result="error")
+        log.error(f"[POST] ❌ Error: {e}")
         return None
 
-def post_thread(text, media_ids=None, media_urls=None):
-    chunks = split_text_into_chunks(text)
+def post_thread(job, feed):
+    key = job["key"]
+    chunks = job["chunks"]
+    if chunks is None:
+        chunks = split_text_into_chunks(job["text"], max_characters(feed), CONTINUATION_MESSAGE, characters_per_url(feed))
+        jobs.update(key, chunks=chunks)
     
-    if len(chunks) == 1:
-        return post_to_mastodon(chunks[0], media_ids)
-    else:
-        print(f"[THREAD] Creating thread with {len(chunks)} posts...")
-        last_status_id = None
-        
-        for i, chunk in enumerate(chunks):
-            print(f"[THREAD] Posting chunk {i+1}/{len(chunks)}")
-            chunk_media_ids = media_ids if i == 0 else None
-            status_id = post_to_mastodon(chunk, chunk_media_ids, reply_to_id=last_status_id)
-            
-            if status_id:
-                last_status_id = status_id
-                time.sleep(2)
-            else:
-                print(f"[THREAD] ❌ Failed to post chunk {i+1}")
-                break
+    if len(chunks) > 1:
+        log.info(f"[THREAD] Creating thread with {len(chunks)} posts...")
+    if job["posted"]:
+        log.info(f"[THREAD] Resuming at chunk {job['posted'] + 1}/{len(chunks)}")
+    
+    last_status_id = job["reply_to_id"]
+    for i in range(job["posted"], len(chunks)):
+        if len(chunks) > 1:
+            log.debug(f"[THREAD] Posting chunk {i+1}/{len(chunks)}")
+        chunk_media_ids = job["media_ids"] if i == 0 else None
+        status_id = post_to_mastodon(chunks[i], feed, chunk_media_ids, reply_to_id=last_status_id, idempotency_key=f"{key}-{i}")
         
-        return last_status_id
+        if not status_id:
+            log.error(f"[THREAD] ❌ Failed to post chunk {i+1}")
+            return None
+        last_status_id = status_id
+        jobs.update(key, posted=i + 1, reply_to_id=status_id)
+    
+    return last_status_id
+
+def account_key(feed):
+    token = hashlib.sha256(feed["MASTODON_TOKEN"].encode('utf-8')).hexdigest()[:16]
+    return f"{feed['MASTODON_URL']}#{token}"
+
+def dedup_key(feed, url):
+    return f"{account_key(feed)}|{url}"
 
-def start_bot():
-    print("[INIT] Bot started with RSSHub + Videos Priority + No Quotes")
+def already_posted(feed, url, posted):
+    # Bare URLs were stored before dedup was per account; they still count.
+    return dedup_key(feed, url) in posted or url in posted
+
+def announce_startup(feeds):
+    feed = feeds[0]
+    account = account_key(feed)
+    # A crash loop or a burst of restarts announces once, not every time.
+    last = jobs.last_announcement(account)
+    if last and time.time() - last < ANNOUNCE_MIN_INTERVAL:
+        log.info(f"[STARTUP] Annonce ignorée, la précédente date de {time.time() - last:.0f}s")
+        return
+    accounts = ", @".join(f["TWITTER_ACCOUNT"] for f in feeds)
     
     startup_msg = STARTUP_MESSAGE_TEMPLATE.format(
         HEURE=datetime.now().strftime('%H:%M:%S'),
         DATE=datetime.now().strftime('%d/%m/%Y'),
-        TWITTER_ACCOUNT=TWITTER_ACCOUNT,
+        TWITTER_ACCOUNT=accounts,
         DELAY=AUTO_DELETE_DELAY
     )
     
-    headers = {"Authorization": f"Bearer {MASTODON_TOKEN}", "Content-Type": "application/json"}
+    headers = {"Authorization": f"Bearer {feed['MASTODON_TOKEN']}", "Content-Type": "application/json"}
     
-    print("[STARTUP] Uploading startup video...")
-    startup_video_id = upload_media(AUTODESTRUCT_VIDEO_URL)
+    log.info(f"[STARTUP] Uploading startup video to {feed['MASTODON_URL']}...")
+    try:
+        startup_video_id = upload_media(AUTODESTRUCT_VIDEO_URL, feed)
+    except MediaRateLimited:
+        startup_video_id = None
     
     data = {"status": startup_msg, "visibility": "public"}
     if startup_video_id:
         data["media_ids"] = [startup_video_id]
     
-    status_id = None
     try:
-        r = requests.post(f"{MASTODON_URL}/api/v1/statuses", headers=headers, json=data)
+        r = mastodon_request(feed, "statuses", http_client.post, "/api/v1/statuses", headers=headers, json=data)
         if r.status_code == 200:
             status_id = r.json()["id"]
-            print("[STARTUP] ✅ Message posted with video! 🎬")
+            log.info("[STARTUP] ✅ Message posted with video! 🎬")
+            # Stored before it is scheduled, so a restart still deletes it.
+            jobs.add_announcement(account, status_id, time.time() + AUTO_DELETE_DELAY)
+            schedule_deletion(feed, status_id, AUTO_DELETE_DELAY)
+    except Exception as e:
+        log.warning(f"[STARTUP] ⚠️ {e}")
+
+def schedule_deletion(feed, status_id, delay):
+    deletion = (account_key(feed), status_id)
+    if deletion in scheduled_deletions:
+        return
+    scheduled_deletions.add(deletion)
+    log.debug(f"[STARTUP] Delete in {delay:.0f}s...")
+    scheduler.call_later(delay, delete_announcement, feed, status_id)
+
+def delete_announcement(feed, status_id, attempt=0):
+    account = account_key(feed)
+    try:
+        r = mastodon_request(feed, "delete", http_client.delete, f"/api/v1/statuses/{status_id}", headers={"Authorization": f"Bearer {feed['MASTODON_TOKEN']}"})
+        if r.status_code in (200, 404):
+            jobs.announcement_deleted(account, status_id)
+            scheduled_deletions.discard((account, status_id))
+            log.info("[STARTUP] ✅ Message deleted! 💣")
+            return
+        error = r.status_code
     except Exception as e:
-        print(f"[STARTUP] ⚠️ {e}")
+        error = e
+    delay = min(60 * 2 ** attempt, 3600)
+    log.warning(f"[STARTUP] ⚠️ Delete failed: {error}, nouvel essai dans {delay}s")
+    scheduler.call_later(delay, delete_announcement, feed, status_id, attempt + 1)
+
+def resume_deletions(feeds):
+    # Announcements whose self-destruct was cut short by a crash or restart.
+    accounts = {account_key(feed): feed for feed in feeds}
+    for pending in jobs.pending_deletions():
+        feed = accounts.get(pending["account"])
+        if feed:
+            schedule_deletion(feed, pending["status_id"], pending["delete_at"] - time.time())
+
+class MediaRateLimited(Exception):
+    pass
+
+def upload_variants(candidates, feed):
+    # Variants of one video, preferred first: the next one is tried when a
+    # variant is too large for the instance or fails to upload.
+    for url in candidates:
+        media_id = upload_media(url, feed)
+        if media_id:
+            return media_id
+    return None
+
+def upload_medias(urls, feed):
+    # Each upload runs with a copy of the caller's log context (feed, entry).
+    return [media_pool.submit(contextvars.copy_context().run, upload_variants, candidates, feed)
+            for candidates in media_optimize.media_candidates(urls, MEDIA_VIDEO_RESOLUTION)]
+
+def entry_content(entry):
+    tweet_description_html = entry.description if hasattr(entry, 'description') else (entry.title if hasattr(entry, 'title') else "No description")
+    
+    with DESCRIPTION_SECONDS.time():
+        tweet_description, media_urls = parse_description(tweet_description_html)
+    if media_urls:
+        log.debug(f"[MEDIA] Found {len(media_urls)} medias (videos + images)")
+    
+    if hasattr(entry, 'enclosures') and entry.enclosures:
+        log.debug(f"[MEDIA] Found {len(entry.enclosures)} enclosures")
+        media_urls = media_urls + [enclosure.href for enclosure in entry.enclosures]
     
-    if status_id:
-        print(f"[STARTUP] Waiting {AUTO_DELETE_DELAY}s before delete...")
-        time.sleep(AUTO_DELETE_DELAY)
+    return tweet_description, media_urls
+
+def needs_media(job):
+    # Media IDs left unattached are deleted by Mastodon after a while: a job
+    # whose first chunk is not posted yet uploads again once they are stale.
+    if job["step"] == "media":
+        return True
+    return job["posted"] == 0 and bool(job["media_ids"]) and time.time() - job["media_ts"] > MEDIA_ID_TTL
+
+def run_job(job, feed, uploads, posted):
+    name = feed["NAME"]
+    key = job["key"]
+    try:
+        if uploads is not None:
+            # Results are collected in submission order so the video-first
+            # ordering of parse_description() is kept.
+            media_ids = [media_id for media_id in (f.result() for f in uploads) if media_id]
+            log.debug(f"[MEDIA] Total: {len(media_ids)}")
+            jobs.update(key, step="post", media_ids=media_ids, media_ts=time.time())
+            job.update(step="post", media_ids=media_ids)
+        
+        if post_thread(job, feed):
+            jobs.update(key, step="done")
+            posted.add(dedup_key(feed, job["url"]))
+            JOBS_DONE.inc(feed=name, result="done")
+            log.info(f"[OK] Posted: {job['url']}")
+            return
+        error = "post failed"
+    except MediaRateLimited as e:
+        error = f"media rate limited (429): {str(e)[:150]}"
+    except Exception as e:
+        error = str(e)[:200]
+    
+    if jobs.retry(key, error):
+        RETRIES.inc(reason="job")
+        log.warning(f"[JOB] ⚠️ {error}, nouvelle tentative plus tard: {job['url']}")
+    else:
+        JOBS_DONE.inc(feed=name, result="failed")
+        log.error(f"[JOB] ❌ Abandon après {JOB_MAX_ATTEMPTS} tentatives: {job['url']}")
+
+def dispatch_jobs(feeds, post_queue, wakeup, stop):
+    # Media stage: uploads of due jobs start here, in the shared media pool,
+    # and the job goes to the poster with its pending uploads. put() blocks
+    # once POST_QUEUE_SIZE jobs are waiting, which bounds the media uploaded
+    # ahead of what Mastodon lets the poster publish.
+    while not stop.is_set():
+        wakeup.wait(DISPATCH_INTERVAL)
+        wakeup.clear()
+        # A backlog is dispatched CATCHUP_BATCH jobs per feed at a time,
+        # round-robin, so one feed catching up does not hold the others back.
+        backlog = True
+        while backlog and not stop.is_set():
+            backlog = False
+            for feed in feeds:
+                try:
+                    due = jobs.due(feed["NAME"], CATCHUP_BATCH, in_flight)
+                except Exception as e:
+                    log.error(f"[JOB] ❌ {feed['NAME']}: {e}")
+                    continue
+                backlog = backlog or len(due) == CATCHUP_BATCH
+                for job in due:
+                    in_flight.add(job["key"])
+                    with logs.context(feed=feed["NAME"], entry=job["key"][:8]):
+                        uploads = upload_medias(job["media_urls"], feed) if needs_media(job) else None
+                    while not stop.is_set():
+                        try:
+                            post_queue.put((job, feed, uploads), timeout=1)
+                            break
+                        except queue.Full:
+                            pass
+
+def post_jobs(post_queue, posted, stop):
+    # Post stage: one thread per Mastodon account publishes jobs in the
+    # order they were dispatched, at whatever pace the rate limiter allows.
+    while not stop.is_set():
         try:
-            requests.delete(f"{MASTODON_URL}/api/v1/statuses/{status_id}", headers={"Authorization": f"Bearer {MASTODON_TOKEN}"})
-            print("[STARTUP] ✅ Message deleted! 💣")
-        except Exception as e:
-            print(f"[STARTUP] ⚠️ Delete failed: {e}")
+            job, feed, uploads = post_queue.get(timeout=1)
+        except queue.Empty:
+            continue
+        try:
+            with logs.context(feed=feed["NAME"], entry=job["key"][:8]):
+                run_job(job, feed, uploads, posted)
+        finally:
+            in_flight.discard(job["key"])
+
+def fetch_feed(feed):
+    name = feed["NAME"]
+    headers_request = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+    }
+    if feed.get("ETAG"):
+        headers_request['If-None-Match'] = feed["ETAG"]
+    if feed.get("LAST_MODIFIED"):
+        headers_request['If-Modified-Since'] = feed["LAST_MODIFIED"]
+    
+    with FETCH_SECONDS.time(feed=name):
+        response = http_client.get(feed["RSSHUB_URL"], headers=headers_request)
+    if response.status_code == 304:
+        FETCHES.inc(feed=name, result="not_modified")
+        log.debug(f"[FETCH] 304 Not Modified")
+        return None, {}
+    
+    validators = {
+        "ETAG": response.headers.get("ETag"),
+        "LAST_MODIFIED": response.headers.get("Last-Modified"),
+        "BODY_HASH": hashlib.sha256(response.content).hexdigest(),
+    }
+    if validators["BODY_HASH"] == feed.get("BODY_HASH"):
+        FETCHES.inc(feed=name, result="unchanged")
+        log.debug(f"[FETCH] Feed unchanged, parsing skipped")
+        feed.update(validators)
+        return None, {}
+    
+    FETCHES.inc(feed=name, result="changed")
+    # Only the entries above the watermark (plus enough for the cadence) are
+    # parsed; without a watermark the whole feed is needed.
+    guid, published = jobs.watermark(name) or (None, None)
+    with PARSE_SECONDS.time(feed=name):
+        feed_data = parse_feed(response.content, guid, published, CADENCE_SAMPLES + 1)
+    if not isinstance(feed_data, Feed):
+        PARSES.inc(feed=name, parser="feedparser")
+    else:
+        PARSES.inc(feed=name, parser="stream_full" if feed_data.complete else "stream_partial")
+    return feed_data, validators
+
+def entry_guid(entry):
+    return entry.get("id") or entry.get("link")
+
+def newest_first(entries):
+    # Feeds are not always sorted: entries are ordered by date when they all
+    # have one, and kept in feed order otherwise.
+    if all(entry_timestamp(entry) for entry in entries):
+        return sorted(entries, key=entry_timestamp, reverse=True)
+    return list(entries)
+
+def unseen_entries(entries, watermark):
+    # Entries above the watermark, oldest first. The walk stops at the
+    # watermark GUID or at the first entry older than its date; entries
+    # sharing the watermark's second are kept and left to the dedup checks.
+    guid, published = watermark
+    unseen = []
+    for entry in entries:
+        if entry_guid(entry) == guid:
+            break
+        timestamp = entry_timestamp(entry)
+        if published and timestamp and timestamp < published:
+            break
+        unseen.append(entry)
+    return unseen[::-1]
+
+def enqueue_entries(feed, posted):
+    feed_data, validators = fetch_feed(feed)
+    if feed_data is None:
+        return 0
+    
+    log.debug(f"[FETCH] Entries: {len(feed_data.entries) if hasattr(feed_data, 'entries') else 0}")
+    
+    if not hasattr(feed_data, 'entries') or len(feed_data.entries) == 0:
+        log.error(f"[FETCH] ❌ Feed empty")
+        return 0
+    
+    feed["CADENCE"] = posting_cadence(feed_data.entries) or feed.get("CADENCE")
+    queued = queue_entries(feed, feed_data.entries, posted)
+    feed.update(validators)
+    return queued
+
+def queue_entries(feed, entries, posted, pushed=False):
+    # Shared by polling and pushes: only entries past the watermark are
+    # stored as jobs, then the watermark moves to the newest entry.
+    name = feed["NAME"]
+    if not entries:
+        return 0
+    entries = newest_first(entries)
+    latest_entry = entries[0]
+    log.debug(f"[FETCH] Latest: {latest_entry.title[:80] if hasattr(latest_entry, 'title') else 'No title'}")
+    
+    watermark = jobs.watermark(name)
+    if watermark:
+        entries = unseen_entries(entries, watermark)
+    elif any(already_posted(feed, getattr(entry, 'link', None), posted) for entry in entries):
+        # No watermark yet but tweets already posted by an older version:
+        # only the entries above the newest posted one are new. Older ones
+        # were left out on purpose by that version's first run.
+        newest_posted = next(i for i, entry in enumerate(entries) if already_posted(feed, getattr(entry, 'link', None), posted))
+        entries = entries[:newest_posted][::-1]
+    else:
+        log.info(f"[FIRST RUN] Posting only the latest tweet...")
+        entries = [latest_entry]
+    
+    if len(entries) > 1:
+        log.info(f"[CATCH-UP] {len(entries)} entrées non vues, publication de la plus ancienne à la plus récente")
     
-    posted = load_cache()
-    print(f"[CACHE] Loaded: {len(posted)} posts")
+    account = account_key(feed)
+    queued = 0
+    for entry in entries:
+        link = getattr(entry, 'link', None)
+        if not link or already_posted(feed, link, posted) or jobs.known(link, account):
+            continue
+        with logs.context(entry=job_key(link, account)[:8]):
+            text, media_urls = entry_content(entry)
+        if jobs.enqueue(name, link, text, media_urls, account):
+            queued += 1
     
-    if len(posted) == 0:
-        print("[FIRST RUN] Posting only the latest tweet...")
+    # New entries are stored as jobs before the watermark and validators are
+    # moved: a failed post is retried from the queue, not by refetching. A
+    # push of an older entry (an edit) doesn't move the watermark back, and
+    # neither does an undated push: its GUID may never show up in the feed,
+    # and the next poll would walk every entry.
+    published = entry_timestamp(latest_entry)
+    if pushed:
+        moves = bool(published) and (not watermark or not watermark[1] or published >= watermark[1])
+    else:
+        moves = not watermark or not watermark[1] or not published or published >= watermark[1]
+    if moves:
+        jobs.set_watermark(name, entry_guid(latest_entry), published)
+    return queued
+
+def check_feed(feed, posted, wakeup, lock):
+    name = feed["NAME"]
+    with logs.context(feed=name):
+        log.info(f"[FETCH] Checking RSSHub...")
         try:
-            print(f"[FETCH] Fetching: {RSSHUB_URL}")
-            headers_request = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            }
-            response = requests.get(RSSHUB_URL, headers=headers_request, timeout=10)
-            print(f"[FETCH] Response: {response.status_code}")
-            
-            feed = feedparser.parse(response.content)
-            print(f"[FETCH] Entries: {len(feed.entries) if hasattr(feed, 'entries') else 0}")
-            
-            if hasattr(feed, 'entries') and len(feed.entries) > 0:
-                entry = feed.entries[0]
-                tweet_url = entry.link if hasattr(entry, 'link') else ""
-                tweet_description_html = entry.description if hasattr(entry, 'description') else (entry.title if hasattr(entry, 'title') else "No description")
-                
-                tweet_description = clean_description(tweet_description_html)
-                
-                media_ids = []
-                
-                description_media = extract_media_from_description(tweet_description_html)
-                if description_media:
-                    print(f"[MEDIA] Found {len(description_media)} medias (videos + images)")
-                    for img_url in description_media:
-                        media_id = upload_media(img_url)
-                        if media_id:
-                            media_ids.append(media_id)
-                
-                if hasattr(entry, 'enclosures') and entry.enclosures:
-                    print(f"[MEDIA] Found {len(entry.enclosures)} enclosures")
-                    for enclosure in entry.enclosures:
-                        media_id = upload_media(enclosure.href)
-                        if media_id:
-                            media_ids.append(media_id)
-                
-                print(f"[MEDIA] Total: {len(media_ids)}")
-                
-                posted_id = post_thread(tweet_description, media_ids, description_media)
-                if posted_id:
-                    posted.append(tweet_url)
-                    save_cache(posted)
-                    print("[FIRST RUN] ✅ First tweet posted!")
+            with lock:
+                queued = enqueue_entries(feed, posted)
+            if queued:
+                log.info(f"[JOB] {queued} tweet(s) en file")
+            else:
+                log.debug(f"[INFO] No new tweets")
+        except Exception as e:
+            FETCHES.inc(feed=name, result="error")
+            log.error(f"[ERROR] {str(e)[:150]}")
+    wakeup.set()
+
+def ingest(feed_name, entries):
+    # Entries pushed through the web UI (WebSub or webhook) go through the
+    # same watermark and dedup checks as a poll, then wake the dispatcher
+    # so they are posted within seconds. None when the feed is unknown.
+    run = dict(active_run)
+    if not run:
+        raise RuntimeError("bot not running")
+    feed = run["feeds"].get(feed_name)
+    if not feed:
+        return None
+    with logs.context(feed=feed_name), run["locks"][feed_name]:
+        feed["LAST_PUSH"] = time.time()
+        queued = queue_entries(feed, entries, run["posted"], pushed=True)
+        log.info(f"[PUSH] {len(entries)} entrée(s) reçue(s), {queued} tweet(s) en file")
+    if queued:
+        run["wakeups"][(feed["MASTODON_URL"], feed["MASTODON_TOKEN"])].set()
+    return queued
+
+def push_active(feed):
+    # A feed that gets pushes is only polled as a safety net.
+    now = time.time()
+    return feed.get("SUBSCRIBED_UNTIL", 0) > now or now - feed.get("LAST_PUSH", 0) < PUSH_TIMEOUT
+
+def websub_subscribe(feed):
+    # Renewed from the scheduler until the run that owns this feed ends.
+    if active_run.get("feeds", {}).get(feed["NAME"]) is not feed:
+        return
+    callback = f"{WEBSUB_CALLBACK_URL.rstrip('/')}/api/ingest/{quote(feed['NAME'], safe='')}"
+    data = {
+        "hub.mode": "subscribe",
+        "hub.topic": feed.get("WEBSUB_TOPIC", feed["RSSHUB_URL"]),
+        "hub.callback": callback,
+        "hub.lease_seconds": WEBSUB_LEASE,
+    }
+    if INGEST_SECRET:
+        data["hub.secret"] = INGEST_SECRET
+    retry = 300
+    with logs.context(feed=feed["NAME"]):
+        try:
+            r = http_client.post(feed["WEBSUB_HUB"], data=data)
+            if r.status_code in (202, 204):
+                feed["SUBSCRIBED_UNTIL"] = time.time() + WEBSUB_LEASE
+                retry = WEBSUB_LEASE / 2
+                log.info(f"[WEBSUB] ✅ Abonnement demandé à {feed['WEBSUB_HUB']}")
             else:
-                print("[FIRST RUN] ❌ No entries")
+                log.warning(f"[WEBSUB] ⚠️ Hub: {r.status_code} {r.text[:150]}")
         except Exception as e:
-            import traceback
-            print(f"[FIRST RUN] ❌ Error: {str(e)[:150]}")
-            print(f"[FIRST RUN] {traceback.format_exc()}")
+            log.warning(f"[WEBSUB] ⚠️ {str(e)[:150]}")
+    scheduler.call_later(retry, websub_subscribe, feed)
+
+def write_metrics(stop):
+    # Snapshot served on /metrics when the web UI runs in another process.
+    while not stop.is_set():
+        try:
+            registry.write(METRICS_FILE)
+        except Exception as e:
+            log.error(f"[METRICS] ❌ {e}")
+        stop.wait(METRICS_INTERVAL)
+
+def start_bot(stop=None, announce=True, snapshot=True):
+    # stop ends the run (config reload); jobs are durable, so whatever was
+    # in flight is picked up again by the next run.
+    stop = stop or threading.Event()
+    log.info("[INIT] Bot started with RSSHub + Videos Priority + No Quotes")
     
-    try:
-        while True:
-            print(f"[{datetime.now()}] Checking RSSHub...")
-            try:
-                headers_request = {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-                }
-                response = requests.get(RSSHUB_URL, headers=headers_request, timeout=10)
-                feed = feedparser.parse(response.content)
+    feeds = load_feeds()
+    log.info(f"[INIT] {len(feeds)} feed(s), {MAX_WORKERS} worker(s)")
+    
+    targets = {}
+    for feed in feeds:
+        targets.setdefault((feed["MASTODON_URL"], feed["MASTODON_TOKEN"]), []).append(feed)
+    
+    posted = DedupStore(CACHE_FILE, CACHE_RETENTION_DAYS)
+    log.info(f"[CACHE] Loaded: {len(posted)} posts")
+    if len(jobs):
+        log.info(f"[JOB] {len(jobs)} tweet(s) en attente repris depuis {JOBS_DB}")
+    
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        # Startup chores run on the scheduler thread: polling starts now.
+        resume_deletions(feeds)
+        if announce:
+            for target_feeds in targets.values():
+                scheduler.call_later(0, announce_startup, target_feeds)
+        
+        # Fetching (this loop and its pool) only stores new tweets as jobs;
+        # each account gets a dispatcher and a poster connected by a bounded
+        # queue, so a slow upload or post never delays the next poll.
+        wakeups = {}
+        # Polls and pushes of the same feed take turns moving its watermark.
+        locks = {feed["NAME"]: threading.Lock() for feed in feeds}
+        workers = []
+        active_run.update(
+            feeds={feed["NAME"]: feed for feed in feeds},
+            locks=locks,
+            posted=posted,
+            wakeups=wakeups,
+        )
+        if WEBSUB_CALLBACK_URL:
+            for feed in feeds:
+                if feed.get("WEBSUB_HUB"):
+                    scheduler.call_later(0, websub_subscribe, feed)
+        for target, target_feeds in targets.items():
+            post_queue = queue.Queue(maxsize=POST_QUEUE_SIZE)
+            post_queues[",".join(feed["NAME"] for feed in target_feeds)] = post_queue
+            wakeups[target] = threading.Event()
+            workers.append(threading.Thread(target=dispatch_jobs, args=(target_feeds, post_queue, wakeups[target], stop), name="dispatch", daemon=True))
+            workers.append(threading.Thread(target=post_jobs, args=(post_queue, posted, stop), name="post", daemon=True))
+        if snapshot:
+            workers.append(threading.Thread(target=write_metrics, args=(stop,), name="metrics", daemon=True))
+        for worker in workers:
+            worker.start()
+        
+        # Busy feeds poll faster only with the fetches quiet ones leave
+        # unused: by default all feeds together never fetch more than they
+        # would at a fixed CHECK_INTERVAL. FETCH_BUDGET (fetches per hour)
+        # raises or lowers that total, -1 lifts it.
+        if FETCH_BUDGET < 0:
+            fetch_budget = None
+        else:
+            fetch_budget = FETCH_BUDGET / 3600 if FETCH_BUDGET else sum(1 / feed["CHECK_INTERVAL"] for feed in feeds)
+        
+        next_check = {}
+        next_maintenance = time.monotonic()
+        running = {}
+        for i, feed in enumerate(feeds):
+            next_check[i] = time.monotonic()
+        
+        try:
+            while not stop.is_set():
+                if not all(worker.is_alive() for worker in workers):
+                    raise RuntimeError("a dispatch or post thread stopped")
                 
-                print(f"[FETCH] Entries: {len(feed.entries) if hasattr(feed, 'entries') else 0}")
+                now = time.monotonic()
+                for i, future in list(running.items()):
+                    if future.done():
+                        del running[i]
+                        feed = feeds[i]
+                        interval = poll_interval(feed.get("CADENCE"), feed["CHECK_INTERVAL"], feed["MIN_CHECK_INTERVAL"], feed["MAX_CHECK_INTERVAL"])
+                        if push_active(feed):
+                            interval = max(interval, PUSH_POLL_INTERVAL)
+                        feed["WANTED_INTERVAL"] = interval
+                        if interval < feed["CHECK_INTERVAL"] and fetch_budget:
+                            factor = budget_factor([(f.get("WANTED_INTERVAL", f["CHECK_INTERVAL"]), f["CHECK_INTERVAL"]) for f in feeds], fetch_budget)
+                            interval = min(interval * factor, feed["MAX_CHECK_INTERVAL"])
+                        interval = jittered(interval, CHECK_JITTER)
+                        next_check[i] = now + interval
+                        log.info(f"[INFO] {feed['NAME']}: next check in {interval:.0f}s...")
                 
-                if hasattr(feed, 'entries') and len(feed.entries) > 0:
-                    latest_entry = feed.entries[0]
-                    print(f"[FETCH] Latest: {latest_entry.title[:80] if hasattr(latest_entry, 'title') else 'No title'}")
-                    
-                    new_count = 0
-                    for entry in feed.entries[:5]:
-                        if not hasattr(entry, 'link'):
-                            continue
-                        
-                        tweet_url = entry.link
-                        if tweet_url not in posted:
-                            tweet_description_html = entry.description if hasattr(entry, 'description') else (entry.title if hasattr(entry, 'title') else "No description")
-                            
-                            tweet_description = clean_description(tweet_description_html)
-                            
-                            media_ids = []
-                            
-                            description_media = extract_media_from_description(tweet_description_html)
-                            if description_media:
-                                print(f"[MEDIA] Found {len(description_media)} medias")
-                                for img_url in description_media:
-                                    media_id = upload_media(img_url)
-                                    if media_id:
-                                        media_ids.append(media_id)
-                            
-                            if hasattr(entry, 'enclosures') and entry.enclosures:
-                                print(f"[MEDIA] Found {len(entry.enclosures)} enclosures")
-                                for enclosure in entry.enclosures:
-                                    media_id = upload_media(enclosure.href)
-                                    if media_id:
-                                        media_ids.append(media_id)
-                            
-                            print(f"[MEDIA] Total: {len(media_ids)}")
-                            
-                            posted_id = post_thread(tweet_description, media_ids, description_media)
-                            if posted_id:
-                                posted.append(tweet_url)
-                                new_count += 1
-                    
-                    if new_count > 0:
-                        save_cache(posted)
-                        print(f"[OK] Posted {new_count} new tweets")
-                    else:
-                        print("[INFO] No new tweets")
+                for i, feed in enumerate(feeds):
+                    if i not in running and next_check[i] <= now:
+                        running[i] = pool.submit(check_feed, feed, posted, wakeups[(feed["MASTODON_URL"], feed["MASTODON_TOKEN"])], locks[feed["NAME"]])
+                
+                # Cache expiry and job purge scan whole tables: hourly, not
+                # on every idle wakeup.
+                if not running and now >= next_maintenance:
+                    posted.maintain()
+                    jobs.purge()
+                    next_maintenance = now + MAINTENANCE_INTERVAL
+                
+                # Woken at least every second to notice stop and dead workers.
+                pending = [next_check[i] for i in next_check if i not in running]
+                delay = min(max(min(pending) - now, 0), 1) if pending else 1
+                if running:
+                    wait(list(running.values()), timeout=delay, return_when=FIRST_COMPLETED)
                 else:
-                    print("[FETCH] ❌ Feed empty")
-            except Exception as e:
-                import traceback
-                print(f"[ERROR] {str(e)[:150]}")
-            
-            print(f"[INFO] Next check in {CHECK_INTERVAL}s...")
-            time.sleep(CHECK_INTERVAL)
-    except KeyboardInterrupt:
-        print("[STOP]")
+                    stop.wait(delay)
+        except KeyboardInterrupt:
+            log.info("[STOP]")
+        finally:
+            stop.set()
+            for future in running.values():
+                future.cancel()
+            for wakeup in wakeups.values():
+                wakeup.set()
+            for worker in workers:
+                worker.join()
+            post_queues.clear()
+            in_flight.clear()
+            active_run.clear()
 
 if __name__ == "__main__":
-    start_bot()
+    try:
+        start_bot()
+    finally:
+        # Don't leave the startup announcement up when the bot is stopped.
+        scheduler.flush()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+COMPACT_MIN_DEAD = 500
+
+log = logging.getLogger(__name__)
+
+class DedupStore:
+    def __init__(self, path, retention_days=0):
+        self.path = path
+        self.retention = retention_days * 86400 if retention_days else 0
+        self.entries = {}
+        self.log_lines = 0
+        self.lock = threading.Lock()
+        self.load()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, url):
+        return url in self.entries
+
+    def load(self):
+        if os.path.isdir(self.path):
+            log.warning(f"[CACHE] ⚠️ {self.path} est un dossier, suppression...")
+            shutil.rmtree(self.path)
+        if not os.path.isfile(self.path):
+            return
+
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                raw = f.read()
+        except Exception as e:
+            log.error(f"[CACHE] ❌ Erreur lecture cache: {e}")
+            return
+
+        if raw.lstrip().startswith('['):
+            self.migrate_legacy(raw)
+            return
+
+        for line in raw.splitlines():
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                self.entries[record["url"]] = record.get("ts", 0)
+            except Exception:
+                log.warning(f"[CACHE] ⚠️ Ligne ignorée: {line[:80]}")
+            self.log_lines += 1
+
+        if self.evict_expired() or self.log_lines - len(self.entries) >= COMPACT_MIN_DEAD:
+            self.compact()
+
+    def migrate_legacy(self, raw):
+        try:
+            urls = json.loads(raw)
+        except Exception as e:
+            log.error(f"[CACHE] ❌ Erreur migration cache: {e}")
+            return
+        now = int(time.time())
+        for url in urls:
+            if url:
+                self.entries[url] = now
+        log.info(f"[CACHE] 🔄 Migration de {len(self.entries)} URLs vers le format journal")
+        self.compact()
+
+    def add(self, url):
+        with self.lock:
+            if url in self.entries:
+                return
+            ts = int(time.time())
+            self.entries[url] = ts
+            try:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps({"url": url, "ts": ts}) + "\n")
+                self.log_lines += 1
+            except Exception as e:
+                log.error(f"[CACHE] ❌ Erreur écriture cache: {e}")
+
+    def evict_expired(self):
+        if not self.retention:
+            return 0
+        cutoff = time.time() - self.retention
+        expired = [url for url, ts in self.entries.items() if ts < cutoff]
+        for url in expired:
+            del self.entries[url]
+        if expired:
+            log.info(f"[CACHE] 🧹 {len(expired)} URLs expirées")
+        return len(expired)
+
+    def maintain(self):
+        with self.lock:
+            if self.evict_expired() or self.log_lines - len(self.entries) >= COMPACT_MIN_DEAD:
+                self.compact()
+
+    def compact(self):
+        # Rewritten in place: the cache file is usually a Docker bind mount,
+        # so it cannot be replaced with os.replace().
+        try:
+            with open(self.path, 'w', encoding='utf-8') as f:
+                for url, ts in self.entries.items():
+                    f.write(json.dumps({"url": url, "ts": ts}) + "\n")
+            self.log_lines = len(self.entries)
+        except Exception as e:
+            log.error(f"[CACHE] ❌ Erreur compaction cache: {e}")
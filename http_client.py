@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+import threading
+
+POOL_SIZE = 10
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 30
+RETRIES = 3
+
+def build_session(pool_size=POOL_SIZE, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT, retries=RETRIES):
+    # requests and urllib3 are a good part of the startup time, so they are
+    # only imported when the first request is made.
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    # Status retries are limited to idempotent methods; POSTs are only
+    # retried when the connection could not be established.
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=0,
+        status=retries,
+        backoff_factor=0.5,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset(["GET", "HEAD", "DELETE"]),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.timeout = (connect_timeout, read_timeout)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+_settings = {}
+_session = None
+_lock = threading.Lock()
+
+def configure(config):
+    global _session
+    with _lock:
+        _settings.update(
+            pool_size=int(config.get("HTTP_POOL_SIZE", POOL_SIZE)),
+            connect_timeout=float(config.get("HTTP_CONNECT_TIMEOUT", CONNECT_TIMEOUT)),
+            read_timeout=float(config.get("HTTP_READ_TIMEOUT", READ_TIMEOUT)),
+            retries=int(config.get("HTTP_RETRIES", RETRIES)),
+        )
+        _session = None
+
+def session():
+    global _session
+    with _lock:
+        if _session is None:
+            _session = build_session(**_settings)
+        return _session
+
+def request(method, url, **kwargs):
+    current = session()
+    kwargs.setdefault("timeout", current.timeout)
+    return current.request(method, url, **kwargs)
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+def delete(url, **kwargs):
+    return request("DELETE", url, **kwargs)
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+RETRY_DELAY = 60
+MAX_RETRY_DELAY = 3600
+DONE_RETENTION = 86400
+FAILED_RETENTION = 30 * 86400
+JSON_FIELDS = ("media_urls", "media_ids", "chunks")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    key TEXT PRIMARY KEY,
+    feed TEXT NOT NULL,
+    url TEXT NOT NULL,
+    step TEXT NOT NULL,
+    text TEXT NOT NULL,
+    media_urls TEXT NOT NULL,
+    media_ids TEXT,
+    media_ts REAL,
+    chunks TEXT,
+    posted INTEGER NOT NULL DEFAULT 0,
+    reply_to_id TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL DEFAULT 0,
+    error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_due ON jobs (feed, step, next_attempt);
+CREATE TABLE IF NOT EXISTS watermarks (
+    feed TEXT PRIMARY KEY,
+    guid TEXT,
+    published REAL
+);
+CREATE TABLE IF NOT EXISTS announcements (
+    account TEXT NOT NULL,
+    status_id TEXT NOT NULL,
+    announced REAL NOT NULL,
+    delete_at REAL NOT NULL,
+    deleted INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (account, status_id)
+);
+"""
+
+def job_key(url, account=""):
+    # Scoped by Mastodon account: a tweet seen by one account's feed (as a
+    # retweet) is still posted by the account mirroring its author.
+    scoped = f"{account}|{url}" if account else url
+    return hashlib.sha256(scoped.encode('utf-8')).hexdigest()[:32]
+
+class JobQueue:
+    # One row per tweet, moving through the steps media -> post -> done.
+    # Every step commits before the next one starts, so a restart resumes
+    # where the bot stopped: uploaded media are reused and a half-posted
+    # thread continues from the last reply_to_id instead of starting over.
+    def __init__(self, path, max_attempts):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM jobs WHERE step IN ('media', 'post')").fetchone()[0]
+
+    def known(self, url, account=""):
+        with self.lock:
+            return self.db.execute("SELECT 1 FROM jobs WHERE key = ?", (job_key(url, account),)).fetchone() is not None
+
+    def enqueue(self, feed_name, url, text, media_urls, account=""):
+        now = time.time()
+        with self.lock:
+            cursor = self.db.execute(
+                "INSERT OR IGNORE INTO jobs (key, feed, url, step, text, media_urls, created, updated) "
+                "VALUES (?, ?, ?, 'media', ?, ?, ?, ?)",
+                (job_key(url, account), feed_name, url, text, json.dumps(media_urls), now, now),
+            )
+            return cursor.rowcount == 1
+
+    def due(self, feed_name, limit=-1, exclude=()):
+        exclude = list(exclude)
+        placeholders = ", ".join("?" * len(exclude))
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT * FROM jobs WHERE feed = ? AND step IN ('media', 'post') AND next_attempt <= ? "
+                f"AND key NOT IN ({placeholders}) ORDER BY created, rowid LIMIT ?",
+                (feed_name, time.time(), *exclude, limit),
+            ).fetchall()
+        jobs = []
+        for row in rows:
+            job = dict(row)
+            for field in JSON_FIELDS:
+                if job[field] is not None:
+                    job[field] = json.loads(job[field])
+            jobs.append(job)
+        return jobs
+
+    def update(self, key, **fields):
+        for field in JSON_FIELDS:
+            if field in fields:
+                fields[field] = json.dumps(fields[field])
+        fields["updated"] = time.time()
+        assignments = ", ".join(f"{field} = ?" for field in fields)
+        with self.lock:
+            self.db.execute(f"UPDATE jobs SET {assignments} WHERE key = ?", (*fields.values(), key))
+
+    def retry(self, key, error):
+        with self.lock:
+            attempts = self.db.execute("SELECT attempts FROM jobs WHERE key = ?", (key,)).fetchone()[0] + 1
+        if attempts >= self.max_attempts:
+            self.update(key, step="failed", attempts=attempts, error=error)
+            return False
+        delay = min(RETRY_DELAY * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+        self.update(key, attempts=attempts, next_attempt=time.time() + delay, error=error)
+        return True
+
+    # Newest entry seen in a feed (GUID and published time): the next check
+    # only walks the entries above it.
+    def watermark(self, feed_name):
+        with self.lock:
+            row = self.db.execute("SELECT guid, published FROM watermarks WHERE feed = ?", (feed_name,)).fetchone()
+        return (row["guid"], row["published"]) if row else None
+
+    def set_watermark(self, feed_name, guid, published):
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO watermarks (feed, guid, published) VALUES (?, ?, ?)", (feed_name, guid, published))
+
+    # Startup announcements waiting for their self-destruct, kept here so a
+    # crash or restart between the post and the delete doesn't leave them up.
+    def add_announcement(self, account, status_id, delete_at):
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO announcements (account, status_id, announced, delete_at) VALUES (?, ?, ?, ?)",
+                (account, status_id, time.time(), delete_at),
+            )
+
+    def last_announcement(self, account):
+        with self.lock:
+            return self.db.execute("SELECT MAX(announced) FROM announcements WHERE account = ?", (account,)).fetchone()[0]
+
+    def pending_deletions(self):
+        with self.lock:
+            rows = self.db.execute("SELECT account, status_id, delete_at FROM announcements WHERE deleted = 0").fetchall()
+        return [dict(row) for row in rows]
+
+    def announcement_deleted(self, account, status_id):
+        with self.lock:
+            self.db.execute("UPDATE announcements SET deleted = 1 WHERE account = ? AND status_id = ?", (account, status_id))
+
+    def purge(self):
+        now = time.time()
+        with self.lock:
+            cursor = self.db.execute(
+                "DELETE FROM jobs WHERE (step = 'done' AND updated < ?) OR (step = 'failed' AND updated < ?)",
+                (now - DONE_RETENTION, now - FAILED_RETENTION),
+            )
+            self.db.execute("DELETE FROM announcements WHERE deleted = 1 AND announced < ?", (now - DONE_RETENTION,))
+            return cursor.rowcount
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+LEVEL = "INFO"
+FORMAT = "text"
+
+feed_context = contextvars.ContextVar("feed", default=None)
+entry_context = contextvars.ContextVar("entry", default=None)
+listener = None
+
+class ContextFilter(logging.Filter):
+    # Runs in the thread that logs, where the context variables are set,
+    # before the record is handed to the writer thread.
+    def filter(self, record):
+        record.feed = feed_context.get()
+        record.entry = entry_context.get()
+        return True
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        correlation = "/".join(value for value in (record.feed, record.entry) if value)
+        prefix = f"{self.formatTime(record, '%Y-%m-%d %H:%M:%S')} {record.levelname:<7} "
+        if correlation:
+            prefix += f"({correlation}) "
+        return prefix + record.getMessage()
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        data = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        if record.feed:
+            data["feed"] = record.feed
+        if record.entry:
+            data["entry"] = record.entry
+        return json.dumps(data, ensure_ascii=False)
+
+def setup(level=LEVEL, output_format=FORMAT):
+    # Records go through an unbounded queue to a single writer thread, so
+    # feed checks, uploads and posts never wait on stdout.
+    global listener
+    # Checked before the running listener is touched: a typo in LOG_LEVEL
+    # must not leave the bot without logs.
+    invalid_level = not isinstance(logging.getLevelName(str(level).upper()), int)
+    if invalid_level:
+        bad_level, level = level, LEVEL
+    if listener:
+        listener.stop()
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter() if output_format == "json" else TextFormatter())
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(str(level).upper())
+
+    listener = logging.handlers.QueueListener(log_queue, stream)
+    listener.start()
+    if invalid_level:
+        logging.getLogger(__name__).warning(f"[LOGS] ⚠️ LOG_LEVEL inconnu: {bad_level}, {LEVEL} utilisé")
+
+def stop():
+    if listener:
+        listener.stop()
+
+atexit.register(stop)
+
+@contextmanager
+def context(feed=None, entry=None):
+    tokens = []
+    if feed is not None:
+        tokens.append((feed_context, feed_context.set(feed)))
+    if entry is not None:
+        tokens.append((entry_context, entry_context.set(entry)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+import logging
+
+import bot
+from supervisor import Supervisor
+
+log = logging.getLogger(__name__)
+
+def run_bot(stop, first_run):
+    # The startup announcement is only posted when the container starts,
+    # not after a config reload or a crash.
+    bot.start_bot(stop, announce=first_run, snapshot=False)
+
+def main():
+    supervisor = Supervisor("bot", run_bot)
+    supervisor.start()
+
+    # Flask is the slowest import; the first feed checks run meanwhile.
+    import app
+    app.BOT_EMBEDDED = True
+    app.ingest_handler = bot.ingest
+    app.config_listeners.append(lambda config: supervisor.restart(lambda: bot.apply_config(config)))
+
+    log.info("[WEB UI] 🚀 Interface web démarrée sur http://0.0.0.0:5000")
+    app.app.run(host='0.0.0.0', port=5000, debug=False, threaded=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from media_stream import download_media
+
+INDEX_FILE = "index.json"
+
+log = logging.getLogger(__name__)
+
+class MediaCache:
+    # Media files are stored under their SHA-256, so several URLs serving the
+    # same bytes share one file. The index maps URLs to digests and is evicted
+    # least-recently-used first once max_bytes is exceeded.
+    def __init__(self, directory, max_bytes, media_id_ttl):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.media_id_ttl = media_id_ttl
+        self.lock = threading.Lock()
+        self.urls = {}
+        self.files = {}
+        self.media_ids = {}
+        self.unattached = {}
+        os.makedirs(directory, exist_ok=True)
+        self.load()
+
+    def load(self):
+        try:
+            with open(os.path.join(self.directory, INDEX_FILE), 'r') as f:
+                index = json.load(f)
+            self.urls = index.get("urls", {})
+            self.files = index.get("files", {})
+            self.unattached = index.get("unattached", {})
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            log.error(f"[MEDIA CACHE] ❌ Erreur lecture index: {e}")
+        for digest in list(self.files):
+            if not os.path.isfile(self.path(digest)):
+                del self.files[digest]
+        self.urls = {url: digest for url, digest in self.urls.items() if digest in self.files}
+
+    def save(self):
+        index = {"urls": self.urls, "files": self.files, "unattached": self.unattached}
+        tmp_path = os.path.join(self.directory, INDEX_FILE + ".tmp")
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(index, f)
+            os.replace(tmp_path, os.path.join(self.directory, INDEX_FILE))
+        except Exception as e:
+            log.error(f"[MEDIA CACHE] ❌ Erreur écriture index: {e}")
+
+    def path(self, digest):
+        return os.path.join(self.directory, digest)
+
+    def lookup(self, url):
+        with self.lock:
+            digest = self.urls.get(url)
+            if not digest:
+                return None
+            info = self.files[digest]
+            info["atime"] = time.time()
+            return digest, info, open(self.path(digest), 'rb')
+
+    def put(self, url, response, max_size):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".part")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                size, digest = download_media(response, max_size, f)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+
+        info = {
+            "size": size,
+            "content_type": response.headers.get("Content-Type", "application/octet-stream"),
+            "atime": time.time(),
+        }
+        with self.lock:
+            os.replace(tmp_path, self.path(digest))
+            self.files[digest] = info
+            self.urls[url] = digest
+            self.evict(keep=digest)
+            self.save()
+            return digest, info, open(self.path(digest), 'rb')
+
+    def evict(self, keep=None):
+        total = sum(info["size"] for info in self.files.values())
+        for digest, info in sorted(self.files.items(), key=lambda item: item[1]["atime"]):
+            if total <= self.max_bytes:
+                break
+            if digest == keep:
+                continue
+            total -= info["size"]
+            del self.files[digest]
+            try:
+                os.remove(self.path(digest))
+            except OSError:
+                pass
+        self.urls = {url: digest for url, digest in self.urls.items() if digest in self.files}
+
+    # Mastodon only lets a media be attached to a single status, and deletes
+    # unattached media after a while. Media IDs are therefore only reused when
+    # an upload ended up not being attached (failed post, 422 fallback), and
+    # only within media_id_ttl seconds.
+    def target_key(self, feed, digest):
+        token_hash = hashlib.sha256(feed["MASTODON_TOKEN"].encode()).hexdigest()[:16]
+        return f"{feed['MASTODON_URL']}|{token_hash}|{digest}"
+
+    def uploaded(self, feed, digest, media_id):
+        with self.lock:
+            self.media_ids[media_id] = self.target_key(feed, digest)
+
+    def take_media_id(self, feed, digest):
+        with self.lock:
+            record = self.unattached.pop(self.target_key(feed, digest), None)
+            if record and time.time() - record["ts"] < self.media_id_ttl:
+                self.media_ids[record["id"]] = self.target_key(feed, digest)
+                return record["id"]
+            return None
+
+    def release(self, media_ids):
+        with self.lock:
+            for media_id in media_ids:
+                key = self.media_ids.pop(media_id, None)
+                if key:
+                    self.unattached[key] = {"id": media_id, "ts": time.time()}
+            now = time.time()
+            self.unattached = {key: record for key, record in self.unattached.items() if now - record["ts"] < self.media_id_ttl}
+            self.save()
+
+    def attached(self, media_ids):
+        with self.lock:
+            for media_id in media_ids:
+                self.media_ids.pop(media_id, None)
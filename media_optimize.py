@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+import importlib.util
+import io
+import math
+import re
+
+VIDEO_ID_PATTERN = re.compile(r'video\.twimg\.com/(?:ext_tw_video|amplify_video)/(\d+)/')
+RESOLUTION_PATTERN = re.compile(r'/(\d+)x(\d+)/')
+JPEG_QUALITIES = (90, 80, 70, 60)
+SCALE_STEPS = 4
+
+def resolution(url):
+    # Short side of the variant ("720" for 1280x720 and 720x1280).
+    match = RESOLUTION_PATTERN.search(url)
+    return min(int(match.group(1)), int(match.group(2))) if match else 0
+
+def media_candidates(urls, max_resolution):
+    # One list of URLs per media. Variants of the same Twitter video are
+    # grouped: the largest one up to max_resolution first, then smaller ones
+    # as fallbacks if it goes over the instance's size limit, larger last.
+    groups = {}
+    for url in urls:
+        match = VIDEO_ID_PATTERN.search(url)
+        groups.setdefault(match.group(1) if match else url, []).append(url)
+    candidates = []
+    for variants in groups.values():
+        fitting = sorted((url for url in variants if resolution(url) <= max_resolution), key=resolution, reverse=True)
+        larger = sorted((url for url in variants if resolution(url) > max_resolution), key=resolution)
+        candidates.append(fitting + larger)
+    return candidates
+
+def pillow_available():
+    # Pillow is optional: without it images are uploaded as downloaded. Only
+    # looked up here, it is imported by the worker processes.
+    return importlib.util.find_spec("PIL") is not None
+
+def optimize_image(data, size_limit, max_pixels):
+    # Runs in a worker process. Returns (bytes, content_type), or None when
+    # the image already fits or can't be brought under the limits.
+    from PIL import Image
+    image = Image.open(io.BytesIO(data))
+    if getattr(image, "is_animated", False):
+        return None
+    width, height = image.size
+    if len(data) <= size_limit and width * height <= max_pixels:
+        return None
+
+    has_alpha = image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+    scale = min(1.0, math.sqrt(max_pixels / (width * height)))
+    for _ in range(SCALE_STEPS):
+        size = (max(int(width * scale), 1), max(int(height * scale), 1))
+        resized = image.resize(size, Image.LANCZOS) if scale < 1 else image
+        for quality in (None,) if has_alpha else JPEG_QUALITIES:
+            out = io.BytesIO()
+            if has_alpha:
+                resized.save(out, "PNG", optimize=True)
+            else:
+                resized.convert("RGB").save(out, "JPEG", quality=quality, optimize=True, progressive=True)
+            if out.tell() <= size_limit:
+                return out.getvalue(), "image/png" if has_alpha else "image/jpeg"
+        scale *= 0.75
+    return None
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+import os
+import hashlib
+import uuid
+import tempfile
+from urllib.parse import urlparse
+
+CHUNK_SIZE = 64 * 1024
+SPOOL_SIZE = 1024 * 1024
+
+class MediaTooLarge(Exception):
+    pass
+
+def download_media(response, max_size, fileobj):
+    length = response.headers.get("Content-Length")
+    if max_size and length and length.isdigit() and int(length) > max_size:
+        raise MediaTooLarge(f"{int(length)} bytes > {max_size}")
+
+    digest = hashlib.sha256()
+    size = 0
+    for chunk in response.iter_content(CHUNK_SIZE):
+        size += len(chunk)
+        if max_size and size > max_size:
+            raise MediaTooLarge(f"> {max_size} bytes")
+        digest.update(chunk)
+        fileobj.write(chunk)
+    return size, digest.hexdigest()
+
+def spool_media(response, max_size):
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    try:
+        size, digest = download_media(response, max_size, spool)
+    except Exception:
+        spool.close()
+        raise
+    spool.seek(0)
+    info = {"size": size, "content_type": response.headers.get("Content-Type", "application/octet-stream")}
+    return digest, info, spool
+
+class MultipartFile:
+    # File-like multipart/form-data body: requests sends it by reading
+    # blocks, so the media is never loaded whole in memory.
+    def __init__(self, fileobj, size, filename, content_type, field="file"):
+        self.boundary = uuid.uuid4().hex
+        self.head = (
+            f"--{self.boundary}\r\n"
+            f"Content-Disposition: form-data; name=\"{field}\"; filename=\"{filename}\"\r\n"
+            f"Content-Type: {content_type}\r\n\r\n"
+        ).encode()
+        self.tail = f"\r\n--{self.boundary}--\r\n".encode()
+        self.fileobj = fileobj
+        self.length = len(self.head) + size + len(self.tail)
+        self.rewind()
+
+    def rewind(self):
+        self.fileobj.seek(0)
+        self.parts = [self.head, None, self.tail]
+
+    @property
+    def content_type(self):
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self):
+        return self.length
+
+    def read(self, size=-1):
+        out = b""
+        while self.parts and (size < 0 or len(out) < size):
+            want = -1 if size < 0 else size - len(out)
+            part = self.parts[0]
+            if part is None:
+                data = self.fileobj.read(want)
+                if not data:
+                    self.parts.pop(0)
+                    continue
+            else:
+                data = part if want < 0 else part[:want]
+                rest = part[len(data):]
+                if rest:
+                    self.parts[0] = rest
+                else:
+                    self.parts.pop(0)
+            out += data
+        return out
+
+def media_filename(url):
+    return os.path.basename(urlparse(url).path) or "media"
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+import calendar
+import random
+import time
+
+CADENCE_SAMPLES = 10
+
+def entry_timestamp(entry):
+    for field in ("published_parsed", "updated_parsed"):
+        value = entry.get(field)
+        if value:
+            return calendar.timegm(value)
+    return None
+
+def posting_cadence(entries):
+    # Mean gap between the most recent entries, and the newest timestamp.
+    times = sorted((ts for ts in map(entry_timestamp, entries) if ts), reverse=True)[:CADENCE_SAMPLES + 1]
+    if len(times) < 2:
+        return None
+    return (times[0] - times[-1]) / (len(times) - 1), times[0]
+
+def poll_interval(cadence, default, min_interval, max_interval):
+    # Polling twice per expected tweet keeps latency around half the
+    # account's posting gap. An account that went quiet stretches the gap
+    # with the time since its last tweet, so dormant feeds drift to the max.
+    if not cadence:
+        return default
+    mean_gap, newest = cadence
+    gap = max(mean_gap, time.time() - newest)
+    return min(max(gap / 2, min_interval), max_interval)
+
+def budget_factor(intervals, budget):
+    # intervals: (wanted interval, CHECK_INTERVAL) per feed; budget: fetches
+    # per second for all feeds. Feeds polled at or below their CHECK_INTERVAL
+    # rate keep their interval; the faster ones share what they leave of the
+    # budget, slowed down by the returned factor when they'd go over it.
+    slow = sum(1 / wanted for wanted, check in intervals if wanted >= check)
+    fast = sum(1 / wanted for wanted, check in intervals if wanted < check)
+    if not fast:
+        return 1
+    return max(fast / max(budget - slow, 1e-9), 1)
+
+def jittered(interval, jitter):
+    return interval * random.uniform(1 - jitter, 1 + jitter)
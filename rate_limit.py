@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+import logging
+import threading
+import time
+from datetime import datetime
+
+BURST_RATIO = 0.1
+DEFAULT_BACKOFF = 60
+
+log = logging.getLogger(__name__)
+
+def parse_reset(value):
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except (AttributeError, ValueError):
+        return None
+
+class Bucket:
+    def __init__(self):
+        self.limit = None
+        self.remaining = None
+        self.reset_at = 0
+        self.next_at = 0
+
+class RateLimiter:
+    # One bucket per (instance, token, endpoint) fed by X-RateLimit-* headers.
+    # Requests go out immediately while plenty of quota is left, are spread
+    # evenly over the window once it runs low and wait for the reset at zero.
+    def __init__(self):
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, key):
+        with self.lock:
+            bucket = self.buckets.setdefault(key, Bucket())
+            now = time.time()
+            if bucket.reset_at <= now:
+                bucket.remaining = None
+
+            slot = max(now, bucket.next_at)
+            if bucket.remaining is not None:
+                if bucket.remaining <= 0:
+                    slot = max(slot, bucket.reset_at)
+                elif bucket.limit and bucket.remaining <= bucket.limit * BURST_RATIO:
+                    slot = max(slot, now + (bucket.reset_at - now) / bucket.remaining)
+                bucket.remaining -= 1
+            bucket.next_at = slot
+
+        delay = slot - time.time()
+        if delay > 0:
+            log.debug(f"[RATE] ⏳ {key[-1]}: waiting {delay:.1f}s")
+            time.sleep(delay)
+
+    def update(self, key, response):
+        headers = response.headers
+        reset_at = parse_reset(headers.get("X-RateLimit-Reset"))
+        with self.lock:
+            bucket = self.buckets.setdefault(key, Bucket())
+            if headers.get("X-RateLimit-Limit", "").isdigit():
+                bucket.limit = int(headers["X-RateLimit-Limit"])
+            if headers.get("X-RateLimit-Remaining", "").isdigit():
+                bucket.remaining = int(headers["X-RateLimit-Remaining"])
+            if reset_at:
+                bucket.reset_at = reset_at
+
+            if response.status_code != 429:
+                return False
+
+            bucket.remaining = 0
+            if not reset_at or reset_at <= time.time():
+                retry_after = headers.get("Retry-After", "")
+                delay = int(retry_after) if retry_after.isdigit() else DEFAULT_BACKOFF
+                bucket.reset_at = time.time() + delay
+            return True
+
+limiter = RateLimiter()
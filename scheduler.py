@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+class Scheduler:
+    # Runs fn(*args) after a delay on a single background thread, so
+    # startup chores (announcement, self-destruct) never hold up polling.
+    # It outlives bot runs: a deletion scheduled before a config reload
+    # still happens after it.
+    def __init__(self, name="scheduler"):
+        self.name = name
+        self.actions = []
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def call_later(self, delay, fn, *args):
+        with self.condition:
+            heapq.heappush(self.actions, (time.monotonic() + max(delay, 0), next(self.counter), fn, args))
+            if not self.thread:
+                self.thread = threading.Thread(target=self.loop, name=self.name, daemon=True)
+                self.thread.start()
+            self.condition.notify()
+
+    def __len__(self):
+        with self.condition:
+            return len(self.actions)
+
+    def loop(self):
+        while True:
+            with self.condition:
+                while not self.actions or self.actions[0][0] > time.monotonic():
+                    self.condition.wait(self.actions[0][0] - time.monotonic() if self.actions else None)
+                _, _, fn, args = heapq.heappop(self.actions)
+            self.run(fn, args)
+
+    def run(self, fn, args):
+        try:
+            fn(*args)
+        except Exception as e:
+            log.exception(f"[SCHEDULER] ❌ {getattr(fn, '__name__', fn)}: {e}")
+
+    def flush(self):
+        # Runs what is pending right away, e.g. before exiting. Actions they
+        # schedule in turn are left for later.
+        with self.condition:
+            actions = sorted(self.actions)
+            self.actions = []
+        for _, _, fn, args in actions:
+            self.run(fn, args)
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+import logging
+import threading
+import time
+
+RESTART_DELAY = 5
+MAX_RESTART_DELAY = 300
+HEALTHY_RUN = 600
+
+log = logging.getLogger(__name__)
+
+class Supervisor:
+    # Runs target(stop, first_run) in a thread and starts it again when it
+    # raises or returns, waiting longer after each quick failure. restart()
+    # ends the current run on purpose (config reload) and starts the next
+    # one right away.
+    def __init__(self, name, target):
+        self.name = name
+        self.target = target
+        self.lock = threading.Lock()
+        self.stop = threading.Event()
+        self.requested = False
+        self.prepare = None
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.loop, name=self.name, daemon=True)
+        self.thread.start()
+
+    def restart(self, prepare=None):
+        # prepare() runs once the current run has fully stopped.
+        with self.lock:
+            self.requested = True
+            self.prepare = prepare
+            self.stop.set()
+
+    def loop(self):
+        delay = RESTART_DELAY
+        first_run = True
+        while True:
+            started = time.monotonic()
+            try:
+                self.target(self.stop, first_run)
+                error = "stopped"
+            except Exception as e:
+                log.exception(f"[SUPERVISOR] ❌ {self.name}: {e}")
+                error = str(e)
+            first_run = False
+
+            with self.lock:
+                requested, prepare = self.requested, self.prepare
+                self.requested = False
+                self.prepare = None
+                self.stop = threading.Event()
+
+            if requested:
+                log.info(f"[SUPERVISOR] 🔄 {self.name}: redémarrage avec la nouvelle configuration")
+                if prepare:
+                    try:
+                        prepare()
+                    except Exception as e:
+                        log.exception(f"[SUPERVISOR] ❌ {self.name}: {e}")
+                delay = RESTART_DELAY
+                continue
+
+            if time.monotonic() - started > HEALTHY_RUN:
+                delay = RESTART_DELAY
+            log.warning(f"[SUPERVISOR] ⚠️ {self.name} arrêté ({error}), redémarrage dans {delay}s")
+            time.sleep(delay)
+            delay = min(delay * 2, MAX_RESTART_DELAY)
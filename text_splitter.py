@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+import re
+from bisect import bisect_left
+
+URL_LENGTH = 23
+URL_PATTERN = re.compile(r'https?://\S+')
+MENTION_DOMAIN_PATTERN = re.compile(r'(?<![\w@])@\w+(@[\w.-]*\w)')
+# Rough grapheme-cluster rules: combining marks, variation selectors, skin
+# tones and tag characters extend the previous character, a zero-width
+# joiner glues the next one, and flags are pairs of regional indicators.
+CLUSTER_PATTERN = re.compile(
+    '[\u0300-\u036f\u1ab0-\u1aff\u1dc0-\u1dff\u20d0-\u20ff\ufe00-\ufe0f\ufe20-\ufe2f'
+    '\U0001F3FB-\U0001F3FF\U000E0020-\U000E007F]|\u200d.?|[\U0001F1E6-\U0001F1FF]{2}',
+    re.DOTALL,
+)
+SENTENCE_ENDS = ('. ', '! ', '? ', '… ', ': ', '; ')
+
+class LengthIndex:
+    # Mastodon's status length rules: URLs count as url_length characters,
+    # remote mentions only count their local part, and characters are
+    # counted as grapheme clusters. Every span where the count differs from
+    # len() is found in one scan of the text; the length of any slice is then
+    # len() plus the deltas inside it, via bisect on prefix sums.
+    def __init__(self, text, url_length=URL_LENGTH):
+        spans = []
+        if '://' in text:
+            spans += [(m.start(), m.end(), url_length) for m in URL_PATTERN.finditer(text)]
+        if '@' in text:
+            spans += [(m.start(1), m.end(1), 0) for m in MENTION_DOMAIN_PATTERN.finditer(text)]
+        if not text.isascii():
+            for m in CLUSTER_PATTERN.finditer(text):
+                flag = m.end() - m.start() == 2 and text[m.start()] >= '\U0001F1E6'
+                spans.append((m.start() + flag, m.end(), 0))
+        spans.sort()
+
+        # A mention or an emoji inside a URL is already counted by the URL.
+        self.positions = []
+        self.ends = []
+        self.url_lengths = []
+        self.deltas = [0]
+        for start, end, counted in spans:
+            if self.ends and start < self.ends[-1]:
+                continue
+            self.positions.append(start)
+            self.ends.append(end)
+            self.url_lengths.append(counted)
+            self.deltas.append(self.deltas[-1] + counted - (end - start))
+
+    def length(self, start, end):
+        first = bisect_left(self.positions, start)
+        last = bisect_left(self.positions, end)
+        length = end - start + self.deltas[last] - self.deltas[first]
+        if last > first and self.ends[last - 1] > end:
+            # The slice ends inside a span: count what is left of it as is,
+            # except that a truncated URL is still a URL.
+            length -= self.deltas[last] - self.deltas[last - 1]
+            length += max(self.url_lengths[last - 1] - (end - self.positions[last - 1]), 0)
+        return length
+
+def mastodon_length(text, url_length=URL_LENGTH):
+    return LengthIndex(text, url_length).length(0, len(text))
+
+def fit(index, text_length, start, budget):
+    # Longest slice text[start:end] that fits in budget. Code points are a
+    # first guess, corrected for URLs and grapheme clusters.
+    end = min(start + budget, text_length)
+    for _ in range(8):
+        excess = index.length(start, end) - budget
+        if excess > 0:
+            end = max(end - excess, start + 1)
+        elif excess < 0 and end < text_length:
+            end = min(end - excess, text_length)
+        else:
+            break
+    while end > start + 1 and index.length(start, end) > budget:
+        end -= 1
+    return end
+
+def find_cut(text, start, end):
+    # Strongest boundary in the second half of the slice: paragraph, line,
+    # sentence, then word. Hard cut at end if the slice has no space.
+    if end >= len(text):
+        return end
+    floor = start + (end - start) // 2
+    for separator in ('\n\n', '\n'):
+        cut = text.rfind(separator, floor, end)
+        if cut != -1:
+            return cut
+    cut = max(text.rfind(separator, floor, end + 1) for separator in SENTENCE_ENDS)
+    if cut != -1:
+        return cut + 1
+    cut = text.rfind(' ', floor, end + 1)
+    if cut != -1:
+        return cut
+    cut = max(text.rfind(' ', start, end + 1), text.rfind('\n', start, end))
+    return cut if cut > start else end
+
+def split_text_into_chunks(text, max_length, continuation="", url_length=URL_LENGTH):
+    index = LengthIndex(text, url_length)
+    if index.length(0, len(text)) <= max_length:
+        return [text]
+
+    suffix = "\n\n" + continuation if continuation else ""
+    budget = max(max_length - mastodon_length(suffix, url_length), 1)
+
+    chunks = []
+    start = 0
+    while start < len(text):
+        if index.length(start, len(text)) <= max_length:
+            rest = text[start:].strip()
+            if mastodon_length(rest, url_length) <= max_length:
+                chunks.append(rest)
+                break
+
+        end = fit(index, len(text), start, budget)
+        cut = find_cut(text, start, end)
+        chunk = text[start:cut].strip()
+        # The index is built on the whole text; a cut can turn the start of a
+        # chunk into a URL of its own, so each chunk is measured once more.
+        while cut > start + 1 and mastodon_length(chunk, url_length) > budget:
+            cut = find_cut(text, start, cut - 1)
+            chunk = text[start:cut].strip()
+        if chunk:
+            chunks.append(chunk + suffix)
+
+        # Skip the whitespace at the cut so the next chunk starts on a word.
+        start = cut
+        while start < len(text) and text[start].isspace():
+            start += 1
+
+    return [chunk for chunk in chunks if chunk]